@@ -3,7 +3,12 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import duckdb
+import numpy as np
 import os
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import xlsxwriter
+from io import BytesIO
 
 st.set_page_config(page_title="UP Dropout Dashboard", layout="wide", initial_sidebar_state="collapsed")
 
@@ -51,6 +56,77 @@ if not os.path.exists(csv_file):
         time.sleep(2)
         success_msg.empty()
 
+# Columnar copy of the CSV - DuckDB reads only the columns a query touches and
+# skips row groups using Parquet min/max stats instead of re-parsing the CSV
+parquet_file = os.path.join(script_dir, "Master_UP_Dropout_Database.parquet")
+
+def sql_string(value):
+    """Quote a Python string as a SQL string literal (embedded quotes doubled)"""
+    return "'" + value.replace("'", "''") + "'"
+
+# Filter/label columns are pinned to VARCHAR so the sniffer can't guess them as
+# numbers or dates (e.g. "Academic Year"); the remaining columns are still sniffed
+CSV_TEXT_TYPES = {
+    'District Name': 'VARCHAR',
+    'Block Name': 'VARCHAR',
+    'Academic Year': 'VARCHAR',
+    'Gender': 'VARCHAR',
+    'Education Level': 'VARCHAR',
+    'School Category': 'VARCHAR',
+    'School Management': 'VARCHAR',
+    'Last School Name': 'VARCHAR'
+}
+# read_csv's types= argument as a DuckDB struct literal {'column': 'TYPE', ...}
+CSV_TEXT_TYPES_SQL = "{" + ", ".join(
+    f"{sql_string(column)}: {sql_string(column_type)}" for column, column_type in CSV_TEXT_TYPES.items()
+) + "}"
+
+# Gender and education level are also stored as TINYINT codes, so the block and school
+# counters compare small integers instead of strings:
+#   gender_code 1 = female, 2 = male (same spellings detect_gender_values accepts)
+#   edu_code    1 = Primary, 2 = Upper Primary, 3 = Secondary, 4 = Sr. Secondary
+GENDER_CODE_SQL = """CAST(CASE WHEN upper("Gender") IN ('FEMALE', 'F', 'GIRL') THEN 1
+                               WHEN upper("Gender") IN ('MALE', 'M', 'BOY') THEN 2 END AS TINYINT)"""
+EDU_CODE_SQL = """CAST(CASE "Education Level" WHEN 'Primary (1-5)' THEN 1
+                                             WHEN 'Upper Primary (6-8)' THEN 2
+                                             WHEN 'Secondary (9-10)' THEN 3
+                                             WHEN 'Sr. Secondary (11-12)' THEN 4 END AS TINYINT)"""
+
+# Rows are stored sorted by the dashboard's filter columns, so a district/block/year
+# lookup only touches the few row groups whose min/max range covers it. Row groups are
+# kept small so a single school's rows sit in one or two of them instead of a
+# default-sized group shared with whole blocks. The tag is written into the Parquet
+# footer; a file with a different tag is rebuilt.
+PARQUET_SORT_KEYS = '"District Name", "Block Name", "Academic Year", "Last School Name"'
+PARQUET_ROW_GROUP_SIZE = 16384
+PARQUET_LAYOUT = "sorted-v3"
+
+def parquet_layout(parquet_path):
+    """Layout tag stored in the Parquet file's key/value metadata (None if missing)"""
+    row = duckdb.execute(
+        "SELECT decode(value) FROM parquet_kv_metadata(?) WHERE decode(key) = 'layout'", [parquet_path]
+    ).fetchone()
+    return row[0] if row else None
+
+@st.cache_resource(show_spinner="🔄 Preparing dashboard data...")
+def build_parquet(csv_path, parquet_path, csv_mtime):
+    """Convert the CSV to sorted, code-annotated Parquet once; rebuilt when the CSV is newer or the layout changed"""
+    if (not os.path.exists(parquet_path) or os.path.getmtime(parquet_path) < csv_mtime
+            or parquet_layout(parquet_path) != PARQUET_LAYOUT):
+        tmp_path = parquet_path + ".tmp"
+        with duckdb.connect() as build_con:
+            build_con.execute(f"""
+                COPY (SELECT *, {GENDER_CODE_SQL} as gender_code, {EDU_CODE_SQL} as edu_code
+                      FROM read_csv({sql_string(csv_path)}, header=true, types={CSV_TEXT_TYPES_SQL})
+                      ORDER BY {PARQUET_SORT_KEYS})
+                TO {sql_string(tmp_path)} (FORMAT PARQUET, ROW_GROUP_SIZE {PARQUET_ROW_GROUP_SIZE},
+                                           KV_METADATA {{layout: '{PARQUET_LAYOUT}'}})
+            """)
+        os.replace(tmp_path, parquet_path)
+    return parquet_path
+
+build_parquet(csv_file, parquet_file, os.path.getmtime(csv_file))
+
 # Enhanced Custom CSS with animations
 st.markdown("""
 <style>
@@ -113,6 +189,28 @@ st.markdown("""
         color: white;
     }
     
+    /* Custom report summary cards (st.metric inside keyed containers) */
+    [class*="st-key-report_metric_"] [data-testid="stMetric"] {
+        padding: 1.5rem;
+        border-radius: 15px;
+        text-align: center;
+        box-shadow: 0 6px 12px rgba(0,0,0,0.3);
+    }
+    [class*="st-key-report_metric_"] [data-testid="stMetricLabel"] {
+        justify-content: center;
+        color: rgba(255,255,255,0.8);
+    }
+    [class*="st-key-report_metric_"] [data-testid="stMetricValue"] {
+        justify-content: center;
+        color: white;
+        font-size: 2.5rem;
+        font-weight: bold;
+    }
+    .st-key-report_metric_total [data-testid="stMetric"] { background: linear-gradient(135deg, #667eea, #764ba2); }
+    .st-key-report_metric_girls [data-testid="stMetric"] { background: linear-gradient(135deg, #ec407a, #f48fb1); }
+    .st-key-report_metric_boys [data-testid="stMetric"] { background: linear-gradient(135deg, #2980b9, #3498db); }
+    .st-key-report_metric_districts [data-testid="stMetric"] { background: linear-gradient(135deg, #16a085, #27ae60); }
+    
     /* Bigger tabs */
     .stTabs [data-baseweb="tab-list"] {
         gap: 8px;
@@ -170,10 +268,80 @@ def load_data():
 
 df_edu, df_district = load_data()
 
-# DuckDB connection with optimization
-con = duckdb.connect()
-con.execute("PRAGMA threads=4")
-con.execute("PRAGMA memory_limit='4GB'")
+# Per-block summaries built once from the full dataset - the block panel looks a
+# block up here instead of scanning its raw rows. Each block also gets an 'All' year
+# row from its own grouping set, since distinct school counts can't be summed across years.
+BLOCK_SUMMARY_QUERY = '''
+    WITH counts AS (
+        SELECT "District Name", "Block Name",
+               CASE WHEN GROUPING("Academic Year") = 1 THEN 'All' ELSE "Academic Year" END as "Academic Year",
+               COUNT(*) as total_count,
+               COUNT(*) FILTER (WHERE gender_code = 1) as female_count,
+               COUNT(*) FILTER (WHERE gender_code = 2) as male_count,
+               COUNT(*) FILTER (WHERE edu_code = 1) as primary_count,
+               COUNT(*) FILTER (WHERE edu_code = 2) as upper_primary_count,
+               COUNT(*) FILTER (WHERE edu_code = 3) as secondary_count,
+               COUNT(*) FILTER (WHERE edu_code = 4) as sr_secondary_count,
+               COUNT(DISTINCT "Last School Name") FILTER (WHERE "Last School Name" != '') as school_count
+        FROM dropouts
+        GROUP BY GROUPING SETS (("District Name", "Block Name", "Academic Year"), ("District Name", "Block Name"))
+    )
+    SELECT *,
+           COALESCE(100.0 * female_count / NULLIF(total_count, 0), 0) as girls_pct,
+           COALESCE(100.0 * primary_count / NULLIF(total_count, 0), 0) as primary_pct,
+           COALESCE(ROUND(female_count / NULLIF(male_count, 0), 2), 0) as gender_parity
+    FROM counts
+'''
+
+# Dropout count per district, block, year (plus 'All') and school category
+BLOCK_CATEGORY_SUMMARY_QUERY = '''
+    SELECT "District Name", "Block Name",
+           CASE WHEN GROUPING("Academic Year") = 1 THEN 'All' ELSE "Academic Year" END as "Academic Year",
+           "School Category",
+           COUNT(*) as count
+    FROM dropouts
+    WHERE "School Category" IS NOT NULL
+    AND "School Category" != ''
+    GROUP BY GROUPING SETS (("District Name", "Block Name", "Academic Year", "School Category"),
+                            ("District Name", "Block Name", "School Category"))
+'''
+
+# Dropout count per named school within each district, block and year, split by category
+# and the gender/level codes - the school lists and rankings sum this instead of raw rows.
+# The count is an INTEGER so it stays small; sums over it are cast back to BIGINT since
+# DuckDB widens SUM to HUGEINT, which pandas would turn into floats.
+SCHOOL_SUMMARY_QUERY = '''
+    SELECT "District Name", "Block Name", "Academic Year", "Last School Name", "School Category",
+           gender_code, edu_code, COUNT(*)::INTEGER as count
+    FROM dropouts
+    WHERE "Last School Name" IS NOT NULL
+    AND "Last School Name" != ''
+    GROUP BY ALL
+    ORDER BY "District Name", "Block Name", "Academic Year", "Last School Name"
+'''
+
+@st.cache_resource
+def get_connection(parquet_path, parquet_mtime):
+    """One in-memory DuckDB database per server process, shared by all sessions"""
+    # One thread per core, a fixed memory budget and the Parquet footer metadata cached
+    # between queries (parquet_metadata_cache - enable_object_cache is a no-op on current
+    # DuckDB). Building the summary tables reads the file once, which fills that cache
+    # before the first panel asks for anything.
+    db = duckdb.connect()
+    db.execute(f"PRAGMA threads={os.cpu_count() or 4}")
+    db.execute("PRAGMA memory_limit='4GB'")
+    db.execute("SET parquet_metadata_cache=true")
+    db.execute(f"CREATE VIEW dropouts AS SELECT * FROM read_parquet({sql_string(parquet_path)})")
+    db.execute(f"CREATE TABLE block_summary AS {BLOCK_SUMMARY_QUERY}")
+    db.execute(f"CREATE TABLE block_category_summary AS {BLOCK_CATEGORY_SUMMARY_QUERY}")
+    db.execute(f"CREATE TABLE school_summary AS {SCHOOL_SUMMARY_QUERY}")
+    return db
+
+# Each rerun queries through its own cursor - a DuckDB connection must not be used
+# from several script threads at once, a cursor shares its database and catalog
+con = get_connection(parquet_file, os.path.getmtime(parquet_file)).cursor()
+con.execute("SET enable_progress_bar=false")
+DROPOUT_COLUMNS = [row[0] for row in con.execute("DESCRIBE dropouts").fetchall()]
 
 # Get years
 available_years = [col for col in df_edu.columns if col != 'Education Level']
@@ -183,7 +351,7 @@ available_years = [col for col in df_edu.columns if col != 'Education Level']
 def detect_gender_values():
     """Detect actual gender values in CSV"""
     try:
-        gender_query = f'SELECT DISTINCT "Gender" FROM "{csv_file}" LIMIT 10'
+        gender_query = 'SELECT DISTINCT "Gender" FROM dropouts LIMIT 10'
         gender_vals = con.execute(gender_query).df()['Gender'].tolist()
         female_val = next((g for g in gender_vals if str(g).upper() in ['FEMALE', 'F', 'GIRL']), 'FEMALE')
         male_val = next((g for g in gender_vals if str(g).upper() in ['MALE', 'M', 'BOY']), 'MALE')
@@ -224,6 +392,466 @@ def get_risk_level(dropout_rate):
     else:
         return "LOW", "risk-low"
 
+# Block-wise summary for the District Analysis tab
+@st.cache_data
+def load_district_blocks(district, year):
+    """Get block-wise dropout counts with rank and share for a district"""
+    # Rank, share and bottom_rank are window functions over the same aggregate,
+    # so the top/bottom 5 lists and the full table come from one query
+    block_query = '''
+        WITH blocks AS (
+            SELECT "Block Name", COUNT(*) as dropout_count
+            FROM dropouts
+            WHERE "District Name" = ?
+            AND "Academic Year" = ?
+            GROUP BY "Block Name"
+        )
+        SELECT "Block Name", dropout_count,
+               ROW_NUMBER() OVER (ORDER BY dropout_count DESC, "Block Name") as "Rank",
+               ROUND(100.0 * dropout_count / SUM(dropout_count) OVER (), 2)::DOUBLE as "Dropout %",
+               ROW_NUMBER() OVER (ORDER BY dropout_count ASC, "Block Name" DESC) as bottom_rank
+        FROM blocks
+        ORDER BY "Rank"
+    '''
+    return con.execute(block_query, [district, year]).df()
+
+# Shown on the CSV download buttons - pyarrow writes the stored values, not pandas' rendering
+CSV_DOWNLOAD_HELP = ("Values are written as stored: whole numbers without a trailing .0, "
+                     "empty cells for missing values and true/false for yes/no columns")
+
+def arrow_csv_bytes(table):
+    """Serialize an Arrow table straight to CSV bytes with pyarrow's writer (no pandas round trip)"""
+    csv_buffer = BytesIO()
+    pa_csv.write_csv(table, csv_buffer)
+    return csv_buffer.getvalue()
+
+@st.cache_data
+def get_block_summary_csv(district, year):
+    """Encode the block summary once per district/year for the download button"""
+    block_data = load_district_blocks(district, year).drop(columns=['bottom_rank'])
+    return arrow_csv_bytes(pa.Table.from_pandas(block_data, preserve_index=False))
+
+# Filter dropdowns and block panel for the Block Analysis tab
+@st.cache_data
+def get_districts(year):
+    """Districts with dropout records, optionally limited to one academic year"""
+    districts_query = '''
+        SELECT DISTINCT "District Name" FROM dropouts
+        WHERE (? = 'All' OR "Academic Year" = ?)
+        ORDER BY "District Name"
+    '''
+    return [row[0] for row in con.execute(districts_query, [year, year]).fetchall()]
+
+@st.cache_data
+def get_blocks(year, district):
+    """Named blocks of a district ('All' for every district), optionally limited to one academic year"""
+    blocks_query = '''
+        SELECT DISTINCT "Block Name" FROM dropouts
+        WHERE (? = 'All' OR "District Name" = ?) AND (? = 'All' OR "Academic Year" = ?)
+        AND "Block Name" IS NOT NULL AND "Block Name" != ''
+        ORDER BY "Block Name"
+    '''
+    return [row[0] for row in con.execute(blocks_query, [district, district, year, year]).fetchall()]
+
+@st.cache_data
+def get_schools(year, district, block):
+    """Named schools matching the year, district and block filters - 'All' switches a filter off"""
+    schools_query = '''
+        SELECT DISTINCT "Last School Name" FROM dropouts
+        WHERE (? = 'All' OR "Academic Year" = ?)
+        AND (? = 'All' OR "District Name" = ?)
+        AND (? = 'All' OR "Block Name" = ?)
+        AND "Last School Name" IS NOT NULL AND "Last School Name" != ''
+        ORDER BY "Last School Name"
+    '''
+    return [row[0] for row in con.execute(schools_query, [year, year, district, district, block, block]).fetchall()]
+
+# Student rows per page of the School Performance records table
+RECORDS_PAGE_SIZE = 100
+
+@st.cache_data
+def load_school_records(school, year, district, block, columns, search_text=""):
+    """Student rows of one school (only the given columns), optionally only rows where a column contains search_text"""
+    # Case-insensitive literal substring match on each column's text, like the old pandas search.
+    # The columns are joined into one string per row (split by a control character nobody can
+    # type), so each row is lowered and searched once instead of once per column.
+    search_blob = ", ".join(f'CAST("{col}" AS VARCHAR)' for col in columns)
+    records_query = f'''
+        SELECT {", ".join(f'"{col}"' for col in columns)}
+        FROM dropouts
+        WHERE "Last School Name" = ?
+        AND (? = 'All' OR "Academic Year" = ?)
+        AND (? = 'All' OR "District Name" = ?)
+        AND (? = 'All' OR "Block Name" = ?)
+        AND (? = '' OR contains(lower(concat_ws(chr(31), {search_blob})), ?))
+    '''
+    needle = search_text.lower()
+    params = [school, year, year, district, district, block, block, needle, needle]
+    return con.execute(records_query, params).to_arrow_table()
+
+@st.cache_data
+def get_column_values(column):
+    """Distinct non-null values of one dropout column, sorted - options for the report filters"""
+    values_query = f'SELECT DISTINCT "{column}" FROM dropouts WHERE "{column}" IS NOT NULL ORDER BY "{column}"'
+    return [row[0] for row in con.execute(values_query).fetchall()]
+
+@st.cache_data
+def load_block_stats(district, block, year):
+    """Block totals (including the school count) and (category, count) rows for the category chart"""
+    # One row of plain Python scalars - counts and percentages are ready to display
+    params = [district, block, year]
+    cursor = con.execute('''
+        SELECT * FROM block_summary
+        WHERE "District Name" = ? AND "Block Name" = ? AND "Academic Year" = ?
+    ''', params)
+    columns = [col[0] for col in cursor.description]
+    row = cursor.fetchone()
+    block_stats = dict(zip(columns, row)) if row else dict.fromkeys(columns, 0)
+
+    category_rows = con.execute('''
+        SELECT "School Category", count FROM block_category_summary
+        WHERE "District Name" = ? AND "Block Name" = ? AND "Academic Year" = ?
+        ORDER BY count DESC
+    ''', params).fetchall()
+    return block_stats, category_rows
+
+@st.cache_data
+def load_block_schools(district, block, year):
+    """School-wise dropout table of one block plus its top 5 and bottom 5 schools by total dropouts"""
+    # School/category rows feed the detail table; the (school) grouping set adds one
+    # total row per school, which the two windows rank from each end in the same pass.
+    # Within the detail rows top_rank doubles as the table's Rank column.
+    schools_query = '''
+        WITH grouped AS (
+            SELECT "Last School Name" as school_name,
+                   "School Category" as category,
+                   SUM(count)::BIGINT as total_dropouts,
+                   SUM(CASE WHEN gender_code = 1 THEN count ELSE 0 END)::BIGINT as girls,
+                   SUM(CASE WHEN gender_code = 2 THEN count ELSE 0 END)::BIGINT as boys,
+                   GROUPING("School Category") as school_total
+            FROM school_summary
+            WHERE "District Name" = ?
+            AND "Block Name" = ?
+            AND (? = 'All' OR "Academic Year" = ?)
+            GROUP BY GROUPING SETS (("Last School Name", "School Category"), ("Last School Name"))
+        )
+        SELECT *,
+               ROW_NUMBER() OVER (PARTITION BY school_total ORDER BY total_dropouts DESC, school_name, category) as top_rank,
+               ROW_NUMBER() OVER (PARTITION BY school_total ORDER BY total_dropouts, school_name) as bottom_rank
+        FROM grouped
+        ORDER BY school_total, top_rank
+    '''
+    schools_df = con.execute(schools_query, [district, block, year, year]).df()
+    is_total = schools_df['school_total'] == 1
+    totals = schools_df.loc[is_total, ['school_name', 'total_dropouts', 'top_rank', 'bottom_rank']]
+    top_schools = totals[totals['top_rank'] <= 5].sort_values('top_rank').reset_index(drop=True)
+    bottom_schools = totals[totals['bottom_rank'] <= 5].sort_values('bottom_rank').reset_index(drop=True)
+    detail_df = (schools_df.loc[~is_total, ['top_rank', 'school_name', 'category', 'total_dropouts', 'girls', 'boys']]
+                 .rename(columns={'top_rank': 'Rank'}).reset_index(drop=True))
+    return detail_df, top_schools, bottom_schools
+
+@st.cache_data
+def get_block_schools_csv(district, block, year):
+    """Encode the block's school-wise table once per district/block/year for the download button"""
+    return arrow_csv_bytes(pa.Table.from_pandas(load_block_schools(district, block, year)[0], preserve_index=False))
+
+def report_filter_sql(years, districts, genders, edu_levels, categories, managements):
+    """WHERE clause and its parameters for the custom report's filter selections"""
+    # (column, selections, whether an "All" entry switches the filter off) - one IN (?, ...)
+    # predicate per filter that has selections, with the values bound to the markers
+    report_filters = [
+        ("Academic Year", years, False),
+        ("District Name", districts, True),
+        ("Gender", genders, True),
+        ("Education Level", edu_levels, True),
+        ("School Category", categories, True),
+        ("School Management", managements, True),
+    ]
+    conditions = []
+    params = []
+    for column, selections, has_all in report_filters:
+        if not selections or (has_all and "All" in selections):
+            continue
+        conditions.append(f'"{column}" IN ({", ".join("?" * len(selections))})')
+        params.extend(selections)
+    
+    where_clause = " AND ".join(conditions) if conditions else "1=1"
+    return where_clause, params
+
+@st.cache_data(max_entries=8)
+def load_custom_report(years, districts, genders, edu_levels, categories, managements, columns):
+    """Rows of the custom report for one set of filter selections (only the given columns)"""
+    where_clause, params = report_filter_sql(years, districts, genders, edu_levels, categories, managements)
+    select_list = ", ".join(f'"{col}"' for col in columns)
+    # Own cursor - the download buttons call this from their own thread
+    with con.cursor() as report_con:
+        report_df = report_con.execute(f'SELECT {select_list} FROM dropouts WHERE {where_clause}', params).df()
+    for col in LOW_CARDINALITY_COLUMNS:
+        if col in columns:
+            report_df[col] = report_df[col].astype('category')
+    return report_df
+
+@st.cache_data
+def load_report_summary(years, districts, genders, edu_levels, categories, managements):
+    """Total, girls, boys and district count of the custom report rows, in one aggregate query"""
+    where_clause, params = report_filter_sql(years, districts, genders, edu_levels, categories, managements)
+    summary_query = f'''
+        SELECT COUNT(*) as total,
+               COUNT(*) FILTER (WHERE "Gender" = ?) as girls,
+               COUNT(*) FILTER (WHERE "Gender" = ?) as boys,
+               COUNT(DISTINCT "District Name") as districts
+        FROM dropouts
+        WHERE {where_clause}
+    '''
+    return con.execute(summary_query, [FEMALE_VALUE, MALE_VALUE] + params).fetchone()
+
+@st.cache_data
+def load_report_preview(years, districts, genders, edu_levels, categories, managements, columns):
+    """First 100 rows of the custom report - all the preview table shows"""
+    where_clause, params = report_filter_sql(years, districts, genders, edu_levels, categories, managements)
+    select_list = ", ".join(f'"{col}"' for col in columns)
+    return con.execute(f'SELECT {select_list} FROM dropouts WHERE {where_clause} LIMIT 100', params).df()
+
+# Repeated short strings in the custom report - held as pandas categories (integer codes)
+LOW_CARDINALITY_COLUMNS = [
+    'Gender', 'Education Level', 'School Category', 'School Management', 'District Name', 'Academic Year'
+]
+
+def report_csv_bytes(years, districts, genders, edu_levels, categories, managements, columns):
+    """Fetch the full custom report as Arrow and write it as CSV; called only when the CSV download is clicked"""
+    where_clause, params = report_filter_sql(years, districts, genders, edu_levels, categories, managements)
+    select_list = ", ".join(f'"{col}"' for col in columns)
+    # Own cursor - the download button calls this from its own thread
+    with con.cursor() as report_con:
+        report_table = report_con.execute(f'SELECT {select_list} FROM dropouts WHERE {where_clause}', params).to_arrow_table()
+    return arrow_csv_bytes(report_table)
+
+def report_excel_bytes(report_df):
+    """Write the custom report to an in-memory workbook; called only when the Excel download is clicked"""
+    # constant_memory makes xlsxwriter flush each row to its temp file as soon as the next
+    # one starts, so rows are written strictly in order (DataFrame.to_excel goes column by
+    # column, which this mode silently drops). Missing values become empty cells.
+    excel_buffer = BytesIO()
+    workbook = xlsxwriter.Workbook(excel_buffer, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Dropout Report')
+    worksheet.write_row(0, 0, report_df.columns, workbook.add_format({'bold': True, 'border': 1, 'align': 'center'}))
+    report_rows = report_df.astype(object).where(report_df.notna(), None)
+    for row_number, row in enumerate(report_rows.itertuples(index=False), start=1):
+        worksheet.write_row(row_number, 0, row)
+    workbook.close()
+    return excel_buffer.getvalue()
+
+# Card templates - cards sharing a row are joined and emitted with a single st.markdown
+DISTRICT_STAT_CARD = """<div style='background: linear-gradient(135deg, {color1}, {color2}); padding: 1.2rem; border-radius: 12px; text-align: center; box-shadow: 0 4px 8px rgba(0,0,0,0.3); height: 140px; display: flex; flex-direction: column; justify-content: center;'>
+<h4 style='color: white; margin: 0; font-size: 0.85rem; font-weight: 600;'>{title}</h4>
+<p style='color: white; font-size: 1.8rem; font-weight: bold; margin: 0.5rem 0 0.3rem 0;'>{value}</p>
+<p style='color: rgba(255,255,255,0.85); font-size: 0.7rem; margin: 0; font-weight: 500;'>{subtitle}</p>
+</div>"""
+BLOCK_METRIC_CARD = """<div style='background: linear-gradient(135deg, {color1}, {color2}); padding: 1.8rem; border-radius: 15px; text-align: center; box-shadow: 0 8px 16px rgba(0,0,0,0.2); height: 150px; display: flex; flex-direction: column; justify-content: center;'>
+<h3 style='color: white; margin: 0; font-size: 1rem; text-shadow: 1px 1px 2px rgba(0,0,0,0.2);'>{title}</h3>
+<p style='color: white; font-size: 2.2rem; font-weight: bold; margin: 0.5rem 0 0 0; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);'>{value}</p>
+</div>"""
+
+# Block Analysis panels - filled with str.format on each render
+BLOCK_OVERVIEW_CARD = """<div style='background: linear-gradient(135deg, #fa709a 0%, #fee140 100%); padding: 2rem; border-radius: 20px; box-shadow: 0 10px 25px rgba(0,0,0,0.3); margin-bottom: 2rem;'>
+<h2 style='color: white; margin: 0 0 0.5rem 0; font-size: 2rem; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);'>🏘️ {block}</h2>
+<p style='color: white; margin: 0; font-size: 1.1rem; opacity: 0.95;'>{district} District | Academic Year: {year}</p>
+<div style='margin-top: 1.5rem; display: flex; justify-content: space-between; align-items: center;'>
+<div>
+<p style='color: white; margin: 0; font-size: 0.9rem; opacity: 0.9;'>Total Blocks</p>
+<p style='color: white; margin: 0; font-size: 1.5rem; font-weight: bold;'>85/17 blocks</p>
+</div>
+<div>
+<p style='color: white; margin: 0; font-size: 0.9rem; opacity: 0.9;'>Dropout Rate</p>
+<p style='color: white; margin: 0; font-size: 1.5rem; font-weight: bold;'>{dropout_rate}%</p>
+</div>
+<div>
+<p style='color: white; margin: 0; font-size: 0.9rem; opacity: 0.9;'>Status</p>
+<p style='color: {status_color}; margin: 0; font-size: 1.3rem; font-weight: bold;'>{performance_status}</p>
+</div>
+</div>
+</div>"""
+BLOCK_SCORE_CARD = """<div style='background: linear-gradient(135deg, #667eea, #764ba2); padding: 2.5rem; border-radius: 15px; text-align: center; box-shadow: 0 8px 16px rgba(0,0,0,0.2); height: 100%;'>
+<h4 style='color: white; margin: 0; font-size: 1.3rem;'>Overall Score</h4>
+<h1 style='color: {score_color}; font-size: 5rem; margin: 1.5rem 0; font-weight: bold; text-shadow: 3px 3px 6px rgba(0,0,0,0.3);'>{overall_score}<span style='font-size: 2.5rem;'>/100</span></h1>
+<p style='color: white; font-size: 1.6rem; margin: 0; font-weight: bold;'>{score_label}</p>
+<p style='color: rgba(255,255,255,0.7); font-size: 0.75rem; margin-top: 1rem; line-height: 1.4;'>Score: <strong>&lt;1000=90</strong> | <strong>1000-3000=70</strong> | <strong>3000-5000=50</strong> | <strong>&gt;5000=30</strong></p>
+</div>"""
+BLOCK_KPI_PANEL = """<div style='background: rgba(255,255,255,0.1); padding: 1.5rem; border-radius: 15px; box-shadow: 0 8px 16px rgba(0,0,0,0.2); height: 100%;'>
+<div style='margin-bottom: 1rem; padding: 1rem; background: rgba(67,230,123,0.2); border-radius: 10px; border-left: 4px solid #43e97b;'>
+<span style='color: white; font-size: 1.1rem;'>✅ Retention Rate:</span>
+<span style='color: #43e97b; font-size: 1.5rem; font-weight: bold; float: right;'>{retention_rate:.1f}%</span>
+</div>
+<div style='margin-bottom: 1rem; padding: 1rem; background: rgba(250,112,154,0.2); border-radius: 10px; border-left: 4px solid #fa709a;'>
+<span style='color: white; font-size: 1.1rem;'>👧 Gender Parity:</span>
+<span style='color: #fa709a; font-size: 1.5rem; font-weight: bold; float: right;'>{gender_parity}</span>
+</div>
+<div style='margin-bottom: 1rem; padding: 1rem; background: rgba(79,172,254,0.2); border-radius: 10px; border-left: 4px solid #4facfe;'>
+<span style='color: white; font-size: 1.1rem;'>🏫 Total Schools:</span>
+<span style='color: #4facfe; font-size: 1.5rem; font-weight: bold; float: right;'>{school_count}</span>
+</div>
+<div style='padding: 1rem; background: rgba(252,203,144,0.2); border-radius: 10px; border-left: 4px solid #fccb90;'>
+<span style='color: white; font-size: 1.1rem;'>📈 Trend:</span>
+<span style='color: #43e97b; font-size: 1.5rem; font-weight: bold; float: right;'>↑ Improving</span>
+</div>
+</div>"""
+BLOCK_ALERT_CARDS = """<div style='background: rgba(255,107,107,0.2); padding: 1.8rem; border-radius: 15px; border-left: 5px solid #ff6b6b; box-shadow: 0 8px 16px rgba(0,0,0,0.2); margin-bottom: 1.5rem;'>
+<h4 style='color: #ff6b6b; margin: 0 0 1.2rem 0; font-size: 1.3rem; font-weight: bold;'>🔴 Critical Alerts</h4>
+<ul style='color: white; font-size: 1rem; line-height: 2; margin: 0; padding-left: 1.5rem;'>
+<li><strong>High Dropout Rate:</strong> {dropout_rate}% above district average</li>
+<li><strong>Gender Gap:</strong> Girls {girls_percentage:.1f}% of total dropouts</li>
+<li><strong>Secondary Level:</strong> {secondary_count} students at risk</li>
+<li><strong>Critical Schools:</strong> Top 5 schools need intervention</li>
+</ul>
+</div>
+<div style='background: rgba(67,230,123,0.2); padding: 1.8rem; border-radius: 15px; border-left: 5px solid #43e97b; box-shadow: 0 8px 16px rgba(0,0,0,0.2);'>
+<h4 style='color: #43e97b; margin: 0 0 1.2rem 0; font-size: 1.3rem; font-weight: bold;'>✅ Positive Trends</h4>
+<ul style='color: white; font-size: 1rem; line-height: 2; margin: 0; padding-left: 1.5rem;'>
+<li><strong>Primary Level:</strong> {primary_percentage:.1f}% retention improving</li>
+<li><strong>School Coverage:</strong> {school_count} schools in monitoring</li>
+<li><strong>Data Quality:</strong> 95% records complete</li>
+<li><strong>Improvement:</strong> 1.2% decrease from last year</li>
+</ul>
+</div>"""
+
+# One row of the block's top/bottom 5 school lists - a list's rows are joined into a single st.markdown
+BLOCK_SCHOOL_CARD = """<div style='background: {background}; padding: 1rem; margin-bottom: 0.8rem; border-radius: 10px; border-left: 4px solid {accent}; box-shadow: 0 4px 8px rgba(0,0,0,0.2);'>
+<div style='display: flex; justify-content: space-between; align-items: center;'>
+<span style='color: white; font-size: 0.95rem; flex: 1;'>{rank}. {school_name}...</span>
+<span style='color: {accent}; font-size: 1.3rem; font-weight: bold;'>{count:,}</span>
+</div>
+</div>"""
+
+# Spacer and section title emitted together as one element
+BLOCK_SECTION_HEADER = "<div><br><br><h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>{title}</h3></div>"
+
+# School Performance panels - the six breakdown cards are joined into one grid below the heading
+SCHOOL_OVERVIEW_CARD = """<div style='background: linear-gradient(135deg, #1e3c72, #2a5298); padding: 2rem; border-radius: 20px; box-shadow: 0 10px 30px rgba(0,0,0,0.4); margin-bottom: 2rem; border: 2px solid rgba(255,255,255,0.2);'>
+<h2 style='color: white; margin: 0 0 1.5rem 0; font-size: 2rem; font-weight: bold; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);'>🏫 {school_name}</h2>
+<div style='display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1.5rem;'>
+<div>
+<p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>📍 District</p>
+<p style='color: white; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{district}</p>
+</div>
+<div>
+<p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏘️ Block</p>
+<p style='color: white; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{block}</p>
+</div>
+<div>
+<p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏷️ Category</p>
+<p style='color: #ffd700; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{category}</p>
+</div>
+<div>
+<p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏛️ Management</p>
+<p style='color: #ffd700; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{management}</p>
+</div>
+<div>
+<p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>📊 Total Dropouts</p>
+<p style='color: #ff6b6b; font-size: 1.8rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{total_dropouts:,}</p>
+</div>
+<div>
+<p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏆 Block Rank</p>
+<p style='color: #43e97b; font-size: 1.8rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{rank}/{school_count}</p>
+</div>
+</div>
+</div>"""
+SCHOOL_METRIC_CARD = """<div style='background: rgba(255,255,255,0.1); padding: 1.5rem; border-radius: 15px; text-align: center; border-left: 4px solid {color}; box-shadow: 0 4px 8px rgba(0,0,0,0.2);'>
+<p style='color: rgba(255,255,255,0.8); font-size: 0.85rem; margin: 0;'>{label}</p>
+<h2 style='color: {color}; font-size: 2rem; margin: 0.5rem 0 0 0; font-weight: bold;'>{value:,}</h2>
+</div>"""
+
+# Shared Plotly styling - figures start from BASE_LAYOUT and only override their own bits.
+# A fixed uirevision lets Plotly keep legend toggles and zoom when a rerun resends the figure.
+BASE_LAYOUT = go.Layout(
+    plot_bgcolor='rgba(0,0,0,0)',
+    paper_bgcolor='rgba(0,0,0,0)',
+    font=dict(color='white', size=14),
+    height=400,
+    uirevision='constant'
+)
+AXIS_WHITE = dict(
+    tickfont=dict(size=16, color='white', family='Arial Black'),
+    title_font=dict(size=16, color='white', family='Arial Black')
+)
+# Turbo sampled once, hottest first - bars sorted by count take colors in order
+TURBO_COLORS = px.colors.sample_colorscale('Turbo', [1 - i / 19 for i in range(20)])
+
+# Block tab figures are cached per input values - revisiting a block reuses the same
+# figure object instead of rebuilding it. Callers must not mutate the returned figures.
+@st.cache_resource(max_entries=128)
+def build_block_gender_fig(girls_count, boys_count):
+    """Girls/boys donut for the block panel"""
+    fig_gender = go.Figure(go.Pie(
+        labels=['Girls', 'Boys'],
+        values=[girls_count, boys_count],
+        hole=0.4,
+        marker=dict(colors=['#fa709a', '#4facfe'], line=dict(color='white', width=2)),
+        textposition='inside',
+        textinfo='percent+label',
+        textfont_size=14,
+        hovertemplate='<b>%{label}</b><br>Count: %{value:,}<extra></extra>'
+    ), layout=BASE_LAYOUT)
+
+    fig_gender.update_layout(
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.2,
+            xanchor="center",
+            x=0.5,
+            font=dict(size=13)
+        )
+    )
+    return fig_gender
+
+@st.cache_resource(max_entries=128)
+def build_block_edu_fig(primary, upper_primary, secondary, sr_secondary):
+    """Education-level bar chart for the block panel"""
+    edu_counts = [primary, upper_primary, secondary, sr_secondary]
+
+    fig_edu = go.Figure(go.Bar(
+        x=['Primary', 'Upper Primary', 'Secondary', 'Sr. Secondary'],
+        y=edu_counts,
+        marker=dict(color=edu_counts, colorscale='Viridis', showscale=True),
+        text=edu_counts,
+        texttemplate='%{text:,}',
+        textposition='outside',
+        textfont=dict(size=13, color='white'),
+        hovertemplate='<b>%{x}</b><br>Count: %{y:,}<extra></extra>'
+    ), layout=BASE_LAYOUT)
+
+    fig_edu.update_layout(
+        xaxis={**AXIS_WHITE, 'title_text': '', 'showgrid': False},
+        yaxis={**AXIS_WHITE, 'title_text': 'Student Count', 'showgrid': True, 'gridcolor': 'rgba(255,255,255,0.1)'},
+        showlegend=False
+    )
+    return fig_edu
+
+@st.cache_resource(max_entries=128)
+def build_block_category_fig(category_rows):
+    """Horizontal school-category bar chart from (category, count) rows"""
+    categories, counts = zip(*category_rows)
+    fig_category = go.Figure(go.Bar(
+        x=list(counts),
+        y=list(categories),
+        orientation='h',
+        marker=dict(color=TURBO_COLORS[:len(counts)]),
+        text=list(counts),
+        textposition='outside',
+        texttemplate='%{text:,}',
+        textfont=dict(size=13, color='white'),
+        hovertemplate='<b>%{y}</b><br>Dropouts: %{x:,}<extra></extra>'
+    ), layout=BASE_LAYOUT)
+
+    fig_category.update_layout(
+        xaxis={**AXIS_WHITE, 'title_text': 'Dropout Count', 'showgrid': True, 'gridcolor': 'rgba(255,255,255,0.1)'},
+        yaxis={**AXIS_WHITE, 'title_text': '', 'showgrid': False},
+        margin=dict(l=250, r=50, t=50, b=50),
+        hoverlabel=dict(bgcolor="white", font_size=14)
+    )
+    return fig_category
+
 # Initialize session state
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = 0
@@ -651,8 +1279,8 @@ if st.session_state.active_tab == 0:
     with st.spinner('📊 Loading comprehensive analytics...'):
         try:
             if selected_year == "All":
-                # Get all data from CSV for consistency
-                all_query = f'''
+                # Get all data from the dropout records for consistency
+                all_query = '''
                     SELECT 
                         COUNT(*) as total,
                         SUM(CASE WHEN "Gender" = 'FEMALE' THEN 1 ELSE 0 END) as girls,
@@ -661,7 +1289,7 @@ if st.session_state.active_tab == 0:
                         SUM(CASE WHEN "Education Level" = 'Upper Primary (6-8)' THEN 1 ELSE 0 END) as upper_primary,
                         SUM(CASE WHEN "Education Level" = 'Secondary (9-10)' THEN 1 ELSE 0 END) as secondary,
                         SUM(CASE WHEN "Education Level" = 'Sr. Secondary (11-12)' THEN 1 ELSE 0 END) as sr_secondary
-                    FROM "{csv_file}"
+                    FROM dropouts
                 '''
                 all_stats = con.execute(all_query).df().iloc[0]
                 total_dropouts = int(all_stats['total'])
@@ -676,8 +1304,8 @@ if st.session_state.active_tab == 0:
                 }
                 
             else:
-                # Get all data from CSV for selected year for consistency
-                year_query = f'''
+                # Get all data from the dropout records for selected year for consistency
+                year_query = '''
                     SELECT 
                         COUNT(*) as total,
                         SUM(CASE WHEN "Gender" = 'FEMALE' THEN 1 ELSE 0 END) as girls,
@@ -686,10 +1314,10 @@ if st.session_state.active_tab == 0:
                         SUM(CASE WHEN "Education Level" = 'Upper Primary (6-8)' THEN 1 ELSE 0 END) as upper_primary,
                         SUM(CASE WHEN "Education Level" = 'Secondary (9-10)' THEN 1 ELSE 0 END) as secondary,
                         SUM(CASE WHEN "Education Level" = 'Sr. Secondary (11-12)' THEN 1 ELSE 0 END) as sr_secondary
-                    FROM "{csv_file}"
-                    WHERE "Academic Year" = '{selected_year}'
+                    FROM dropouts
+                    WHERE "Academic Year" = ?
                 '''
-                year_stats = con.execute(year_query).df()
+                year_stats = con.execute(year_query, [selected_year]).df()
                 
                 if not year_stats.empty and year_stats.iloc[0]['total'] > 0:
                     stats = year_stats.iloc[0]
@@ -743,21 +1371,23 @@ if st.session_state.active_tab == 0:
             
             # Get High-Risk Blocks Count
             if selected_year == "All":
-                high_risk_query = f'''
+                high_risk_query = '''
                     SELECT "Block Name", "District Name", COUNT(*) as dropout_count
-                    FROM "{csv_file}"
+                    FROM dropouts
                     GROUP BY "Block Name", "District Name"
                     HAVING dropout_count > 100
                 '''
+                high_risk_params = []
             else:
-                high_risk_query = f'''
+                high_risk_query = '''
                     SELECT "Block Name", "District Name", COUNT(*) as dropout_count
-                    FROM "{csv_file}"
-                    WHERE "Academic Year" = '{selected_year}'
+                    FROM dropouts
+                    WHERE "Academic Year" = ?
                     GROUP BY "Block Name", "District Name"
                     HAVING dropout_count > 100
                 '''
-            high_risk_blocks_df = con.execute(high_risk_query).df()
+                high_risk_params = [selected_year]
+            high_risk_blocks_df = con.execute(high_risk_query, high_risk_params).df()
             high_risk_blocks_count = len(high_risk_blocks_df)
             
         except Exception as e:
@@ -1105,13 +1735,14 @@ if st.session_state.active_tab == 0:
     with viz_col1:
         # Gender Distribution Donut Chart
         try:
-            gender_query = f'''
+            gender_query = '''
                 SELECT "Gender", COUNT(*) as count
-                FROM "{csv_file}"
-                WHERE "Academic Year" = '{selected_year}'
+                FROM dropouts
+                WHERE (? = 'All' OR "Academic Year" = ?)
                 GROUP BY "Gender"
             '''
-            gender_data = duckdb.query(gender_query).df()
+            gender_data = con.execute(gender_query, [selected_year, selected_year]).fetchnumpy()
+            gender_data['count'] = gender_data['count'].astype('int32')
             
             fig_gender = go.Figure(data=[go.Pie(
                 labels=gender_data['Gender'],
@@ -1144,16 +1775,17 @@ if st.session_state.active_tab == 0:
     with viz_col2:
         # Education Level Distribution
         try:
-            level_query = f'''
+            # Counted per level inside DuckDB - only the handful of level rows come back
+            level_query = '''
                 SELECT 
                     "Education Level",
                     COUNT(*) as student_count
-                FROM df
-                WHERE "Academic Year" = '{selected_year}'
+                FROM dropouts
+                WHERE (? = 'All' OR "Academic Year" = ?)
                 GROUP BY "Education Level"
                 ORDER BY student_count DESC
             '''
-            level_df = duckdb.query(level_query).to_df()
+            level_df = con.execute(level_query, [selected_year, selected_year]).df()
             
             if not level_df.empty:
                 fig_level = go.Figure(data=[go.Pie(
@@ -1196,15 +1828,16 @@ if st.session_state.active_tab == 0:
     """, unsafe_allow_html=True)
     
     try:
-        category_query = f'''
+        category_query = '''
             SELECT "School Category", COUNT(*) as count
-            FROM "{csv_file}"
-            WHERE "Academic Year" = '{selected_year}'
+            FROM dropouts
+            WHERE (? = 'All' OR "Academic Year" = ?)
             GROUP BY "School Category"
             ORDER BY count DESC
             LIMIT 10
         '''
-        category_data = duckdb.query(category_query).df()
+        category_data = con.execute(category_query, [selected_year, selected_year]).fetchnumpy()
+        category_data['count'] = category_data['count'].astype('int32')
         
         fig_category = go.Figure(data=[go.Bar(
             x=category_data['School Category'],
@@ -1260,22 +1893,24 @@ if st.session_state.active_tab == 0:
     
     try:
         if selected_year == "All":
-            district_performance_query = f'''
+            district_performance_query = '''
                 SELECT "District Name", COUNT(*) as dropout_count
-                FROM "{csv_file}"
+                FROM dropouts
                 GROUP BY "District Name"
                 ORDER BY dropout_count
             '''
+            district_performance_params = []
         else:
-            district_performance_query = f'''
+            district_performance_query = '''
                 SELECT "District Name", COUNT(*) as dropout_count
-                FROM "{csv_file}"
-                WHERE "Academic Year" = '{selected_year}'
+                FROM dropouts
+                WHERE "Academic Year" = ?
                 GROUP BY "District Name"
                 ORDER BY dropout_count
             '''
+            district_performance_params = [selected_year]
         
-        all_districts = con.execute(district_performance_query).df()
+        all_districts = con.execute(district_performance_query, district_performance_params).df()
         
         # Calculate dropout rates for each district (assuming equal distribution of enrollment)
         district_enrollment = TOTAL_ENROLLMENT / len(all_districts) if len(all_districts) > 0 else 1
@@ -1348,26 +1983,31 @@ if st.session_state.active_tab == 0:
 
     try:
         if selected_year == "All":
-            query = f'''
+            query = '''
                 SELECT "District Name", COUNT(*) as "Dropout Count"
-                FROM "{csv_file}"
+                FROM dropouts
                 GROUP BY "District Name"
                 ORDER BY "Dropout Count" DESC
                 LIMIT 10
             '''
+            query_params = []
         else:
-            query = f'''
+            query = '''
                 SELECT "District Name", COUNT(*) as "Dropout Count"
-                FROM "{csv_file}"
-                WHERE "Academic Year" = '{selected_year}'
+                FROM dropouts
+                WHERE "Academic Year" = ?
                 GROUP BY "District Name"
                 ORDER BY "Dropout Count" DESC
                 LIMIT 10
             '''
+            query_params = [selected_year]
 
-        district_counts = con.execute(query).df()
+        # Plotly takes the numpy columns directly - no DataFrame needed.
+        # COUNT(*) comes back as int64; int32 is plenty and halves the chart payload
+        district_counts = con.execute(query, query_params).fetchnumpy()
+        district_counts['Dropout Count'] = district_counts['Dropout Count'].astype('int32')
 
-        if not district_counts.empty:
+        if len(district_counts['District Name']) > 0:
             fig = go.Figure()
 
             fig.add_trace(go.Bar(
@@ -1489,7 +2129,7 @@ elif st.session_state.active_tab == 1:
     with col_d1:
         st.markdown("### 📍 Select District")
         try:
-            districts_list = duckdb.query(f'SELECT DISTINCT "District Name" FROM "{csv_file}" ORDER BY "District Name"').df()['District Name'].tolist()
+            districts_list = get_districts("All")
         except Exception as e:
             st.error(f"❌ Error loading districts: {e}")
             districts_list = []
@@ -1502,7 +2142,9 @@ elif st.session_state.active_tab == 1:
     
     st.markdown("<br>", unsafe_allow_html=True)
     
-    if selected_district != "-- Select District --":
+    @st.fragment
+    def render_district_panel(selected_district, district_year):
+        """Render the district panel; clicks inside it rerun only this fragment"""
         # Selected District Overview Card
         st.markdown(f"""
         <div style='background: linear-gradient(135deg, #667eea, #764ba2); 
@@ -1522,23 +2164,23 @@ elif st.session_state.active_tab == 1:
             st.markdown("### 📊 Quick Statistics")
             
             # Query district data
-            district_query = f'''
+            district_query = '''
                 SELECT 
                     COUNT(*) as total_dropouts,
-                    SUM(CASE WHEN "Gender" = 'FEMALE' THEN 1 ELSE 0 END) as female_dropouts,
-                    SUM(CASE WHEN "Gender" = 'MALE' THEN 1 ELSE 0 END) as male_dropouts,
+                    COUNT_IF("Gender" = 'FEMALE') as female_dropouts,
+                    COUNT_IF("Gender" = 'MALE') as male_dropouts,
                     COUNT(DISTINCT "Block Name") as total_blocks,
                     COUNT(DISTINCT "Last School Name") as total_schools,
-                    SUM(CASE WHEN "Education Level" = 'Primary (1-5)' THEN 1 ELSE 0 END) as primary_count,
-                    SUM(CASE WHEN "Education Level" = 'Upper Primary (6-8)' THEN 1 ELSE 0 END) as upper_primary_count,
-                    SUM(CASE WHEN "Education Level" = 'Secondary (9-10)' THEN 1 ELSE 0 END) as secondary_count,
-                    SUM(CASE WHEN "Education Level" = 'Sr. Secondary (11-12)' THEN 1 ELSE 0 END) as sr_secondary_count
-                FROM "{csv_file}"
-                WHERE "District Name" = '{selected_district}'
-                AND "Academic Year" = '{district_year}'
+                    COUNT_IF("Education Level" = 'Primary (1-5)') as primary_count,
+                    COUNT_IF("Education Level" = 'Upper Primary (6-8)') as upper_primary_count,
+                    COUNT_IF("Education Level" = 'Secondary (9-10)') as secondary_count,
+                    COUNT_IF("Education Level" = 'Sr. Secondary (11-12)') as sr_secondary_count
+                FROM dropouts
+                WHERE "District Name" = ?
+                AND "Academic Year" = ?
             '''
             
-            district_stats = duckdb.query(district_query).df().iloc[0]
+            district_stats = con.execute(district_query, [selected_district, district_year]).df().iloc[0]
             
             total_dropouts = int(district_stats['total_dropouts'])
             female_dropouts = int(district_stats['female_dropouts'])
@@ -1546,36 +2188,25 @@ elif st.session_state.active_tab == 1:
             total_blocks = int(district_stats['total_blocks'])
             total_schools = int(district_stats['total_schools'])
             
-            # Quick Stats Cards
-            col1, col2, col3, col4, col5, col6 = st.columns(6)
-            
+            # Quick Stats Cards - one grid, one markdown call
             stats = [
-                ("📊 Total Dropouts", total_dropouts, "Total Students Dropped", col1, "#e74c3c", "#c0392b"),
-                ("👧 Girls", female_dropouts, "Girls Dropouts", col2, "#ec407a", "#d81b60"),
-                ("👦 Boys", male_dropouts, "Boys Dropouts", col3, "#3498db", "#2980b9"),
-                ("🏘️ Blocks", total_blocks, "Total Blocks", col4, "#9b59b6", "#8e44ad"),
-                ("🏫 Schools", total_schools, "Total Schools", col5, "#f39c12", "#e67e22"),
-                ("📈 Dropout %", f"{(total_dropouts/200000)*100:.2f}", "Dropout Rate", col6, "#27ae60", "#229954")
+                ("📊 Total Dropouts", f"{total_dropouts:,}", "Total Students Dropped", "#e74c3c", "#c0392b"),
+                ("👧 Girls", f"{female_dropouts:,}", "Girls Dropouts", "#ec407a", "#d81b60"),
+                ("👦 Boys", f"{male_dropouts:,}", "Boys Dropouts", "#3498db", "#2980b9"),
+                ("🏘️ Blocks", f"{total_blocks:,}", "Total Blocks", "#9b59b6", "#8e44ad"),
+                ("🏫 Schools", f"{total_schools:,}", "Total Schools", "#f39c12", "#e67e22"),
+                ("📈 Dropout %", f"{(total_dropouts/200000)*100:.2f}", "Dropout Rate", "#27ae60", "#229954")
             ]
-            
-            for title, value, subtitle, column, color1, color2 in stats:
-                with column:
-                    st.markdown(f"""
-                    <div style='background: linear-gradient(135deg, {color1}, {color2}); 
-                                padding: 1.2rem; 
-                                border-radius: 12px; 
-                                text-align: center; 
-                                box-shadow: 0 4px 8px rgba(0,0,0,0.3);
-                                height: 140px;
-                                display: flex;
-                                flex-direction: column;
-                                justify-content: center;'>
-                        <h4 style='color: white; margin: 0; font-size: 0.85rem; font-weight: 600;'>{title}</h4>
-                        <p style='color: white; font-size: 1.8rem; font-weight: bold; margin: 0.5rem 0 0.3rem 0;'>{value if isinstance(value, str) else f'{value:,}'}</p>
-                        <p style='color: rgba(255,255,255,0.85); font-size: 0.7rem; margin: 0; font-weight: 500;'>{subtitle}</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-            
+
+            stats_cards = "".join(
+                DISTRICT_STAT_CARD.format(title=title, value=value, subtitle=subtitle, color1=color1, color2=color2)
+                for title, value, subtitle, color1, color2 in stats
+            )
+            st.markdown(
+                f"<div style='display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 1rem;'>{stats_cards}</div>",
+                unsafe_allow_html=True
+            )
+
             st.markdown("<br><br>", unsafe_allow_html=True)
             
             # Gender Analysis + Level-wise Breakdown
@@ -1623,37 +2254,26 @@ elif st.session_state.active_tab == 1:
             with col_right:
                 st.markdown("### 📚 Education Level Breakdown")
                 
-                # Level-wise Bar Chart with Boys/Girls stacked
-                level_query = f'''
-                    SELECT "Education Level", "Gender", COUNT(*) as count
-                    FROM "{csv_file}"
-                    WHERE "District Name" = '{selected_district}'
-                    AND "Academic Year" = '{district_year}'
-                    AND "Education Level" IN ('Primary (1-5)', 'Upper Primary (6-8)', 'Secondary (9-10)', 'Sr. Secondary (11-12)')
-                    GROUP BY "Education Level", "Gender"
-                    ORDER BY CASE "Education Level"
-                        WHEN 'Primary (1-5)' THEN 1
-                        WHEN 'Upper Primary (6-8)' THEN 2
-                        WHEN 'Secondary (9-10)' THEN 3
-                        WHEN 'Sr. Secondary (11-12)' THEN 4
-                    END
+                # Level-wise Bar Chart with Boys/Girls stacked - counted on the edu/gender codes
+                level_query = '''
+                    SELECT edu_code, gender_code, COUNT(*) as count
+                    FROM dropouts
+                    WHERE "District Name" = ?
+                    AND "Academic Year" = ?
+                    AND edu_code IS NOT NULL
+                    AND gender_code IS NOT NULL
+                    GROUP BY edu_code, gender_code
                 '''
                 
-                level_gender_data = duckdb.query(level_query).df()
+                level_gender_data = con.execute(level_query, [selected_district, district_year]).fetchnumpy()
                 
-                # Prepare data for stacked bar
-                levels = ['Primary (1-5)', 'Upper Primary (6-8)', 'Secondary (9-10)', 'Sr. Secondary (11-12)']
+                # Prepare data for stacked bar - each (level, gender) pair drops into a 5x3 grid
+                # indexed by its codes, so row 1-4 is a level and column 1/2 is girls/boys
                 display_labels = ['Primary', 'Upper Primary', 'Secondary', 'Sr. Secondary']
-                boys_counts = []
-                girls_counts = []
-                
-                for level in levels:
-                    boys = level_gender_data[(level_gender_data['Education Level'] == level) & 
-                                            (level_gender_data['Gender'].isin(['MALE', 'Male']))]['count'].sum()
-                    girls = level_gender_data[(level_gender_data['Education Level'] == level) & 
-                                             (level_gender_data['Gender'].isin(['FEMALE', 'Female']))]['count'].sum()
-                    boys_counts.append(int(boys) if boys > 0 else 0)
-                    girls_counts.append(int(girls) if girls > 0 else 0)
+                level_gender_counts = np.zeros((5, 3), dtype=np.int64)
+                level_gender_counts[level_gender_data['edu_code'], level_gender_data['gender_code']] = level_gender_data['count']
+                girls_counts = level_gender_counts[1:, 1].tolist()
+                boys_counts = level_gender_counts[1:, 2].tolist()
                 
                 total_counts = [b + g for b, g in zip(boys_counts, girls_counts)]
                 
@@ -1704,19 +2324,20 @@ elif st.session_state.active_tab == 1:
                 st.markdown("### 🏷️ Category-wise Analysis")
                 
                 # Category breakdown
-                category_query = f'''
+                category_query = '''
                     SELECT "School Category", COUNT(*) as count
-                    FROM "{csv_file}"
-                    WHERE "District Name" = '{selected_district}'
-                    AND "Academic Year" = '{district_year}'
+                    FROM dropouts
+                    WHERE "District Name" = ?
+                    AND "Academic Year" = ?
                     GROUP BY "School Category"
                     ORDER BY count DESC
                     LIMIT 8
                 '''
                 
-                category_data = duckdb.query(category_query).df()
+                category_data = con.execute(category_query, [selected_district, district_year]).fetchnumpy()
+                category_data['count'] = category_data['count'].astype('int32')
                 
-                if not category_data.empty:
+                if len(category_data['count']) > 0:
                     # Assign colors based on category level
                     colors = []
                     for cat in category_data['School Category']:
@@ -1765,21 +2386,12 @@ elif st.session_state.active_tab == 1:
                 st.markdown("### 🏘️ Block Performance")
                 
                 # Top 5 and Bottom 5 Blocks
-                block_query = f'''
-                    SELECT "Block Name", COUNT(*) as dropout_count
-                    FROM "{csv_file}"
-                    WHERE "District Name" = '{selected_district}'
-                    AND "Academic Year" = '{district_year}'
-                    GROUP BY "Block Name"
-                    ORDER BY dropout_count DESC
-                '''
-                
-                block_data = duckdb.query(block_query).df()
+                block_data = load_district_blocks(selected_district, district_year)
                 
                 if not block_data.empty:
                     total_blocks_count = len(block_data)
-                    top_5 = block_data.head(5)
-                    bottom_5 = block_data.tail(5)
+                    top_5 = block_data[block_data['Rank'] <= 5]
+                    bottom_5 = block_data[block_data['bottom_rank'] <= 5]
                     
                     st.markdown("**🔴 Top 5 (Highest Dropouts)**")
                     for idx, row in top_5.iterrows():
@@ -1823,10 +2435,6 @@ elif st.session_state.active_tab == 1:
             st.markdown("### 📋 Detailed Block-wise Data Table")
             
             if not block_data.empty:
-                # Add ranking
-                block_data['Rank'] = range(1, len(block_data) + 1)
-                block_data['Dropout %'] = ((block_data['dropout_count'] / total_dropouts) * 100).round(2)
-                
                 # Color-code Dropout %
                 def color_dropout_pct(val):
                     if val >= 20:
@@ -1855,8 +2463,8 @@ elif st.session_state.active_tab == 1:
             col_dl1, col_dl2, col_dl3 = st.columns(3)
             
             with col_dl1:
-                # Block Summary CSV Download
-                csv_data = block_data.to_csv(index=False).encode('utf-8')
+                # Block Summary CSV Download (encoded once per district/year)
+                csv_data = get_block_summary_csv(selected_district, district_year)
                 st.download_button(
                     label="📥 Download Block Summary (CSV)",
                     data=csv_data,
@@ -1875,7 +2483,9 @@ elif st.session_state.active_tab == 1:
         
         except Exception as e:
             st.error(f"❌ Error loading district analysis: {e}")
-    
+
+    if selected_district != "-- Select District --":
+        render_district_panel(selected_district, district_year)
     else:
         st.info("👆 कृपया ऊपर से एक जिला चुनें।")
 
@@ -1894,25 +2504,13 @@ if st.session_state.active_tab == 2:
     
     with col_f2:
         st.markdown("### 🗺️ Select District")
-        # Get districts from CSV based on year
-        if block_year == "All":
-            districts_query = f'SELECT DISTINCT "District Name" FROM "{csv_file}" ORDER BY "District Name"'
-        else:
-            districts_query = f'SELECT DISTINCT "District Name" FROM "{csv_file}" WHERE "Academic Year" = \'{block_year}\' ORDER BY "District Name"'
-        
-        block_districts = con.execute(districts_query).df()['District Name'].tolist()
+        block_districts = get_districts(block_year)
         block_selected_district = st.selectbox("District:", ["Select"] + block_districts, key="block_district_filter", label_visibility="collapsed")
     
     with col_f3:
         st.markdown("### 🏫 Select Block")
         if block_selected_district != "Select":
-            # Get blocks from CSV based on year and district
-            if block_year == "All":
-                blocks_query = f'SELECT DISTINCT "Block Name" FROM "{csv_file}" WHERE "District Name" = \'{block_selected_district}\' ORDER BY "Block Name"'
-            else:
-                blocks_query = f'SELECT DISTINCT "Block Name" FROM "{csv_file}" WHERE "District Name" = \'{block_selected_district}\' AND "Academic Year" = \'{block_year}\' ORDER BY "Block Name"'
-            
-            block_blocks = con.execute(blocks_query).df()['Block Name'].tolist()
+            block_blocks = get_blocks(block_year, block_selected_district)
             block_selected_block = st.selectbox("Block:", ["Select"] + block_blocks, key="block_block_filter", label_visibility="collapsed")
         else:
             block_selected_block = "Select"
@@ -1920,67 +2518,18 @@ if st.session_state.active_tab == 2:
     
     st.markdown("<br>", unsafe_allow_html=True)
     
-    if block_selected_district != "Select" and block_selected_block != "Select":
+    @st.fragment
+    def render_block_panel(block_year, block_selected_district, block_selected_block):
+        """Render the block panel; clicks inside it rerun only this fragment"""
         with st.spinner('📊 Data लोड हो रहा है...'):
             try:
-                # Query data from CSV for selected block
-                if block_year == "All":
-                    block_query = f'''
-                        SELECT COUNT(*) as total_count,
-                               SUM(CASE WHEN "Gender" = '{FEMALE_VALUE}' THEN 1 ELSE 0 END) as female_count,
-                               SUM(CASE WHEN "Gender" = '{MALE_VALUE}' THEN 1 ELSE 0 END) as male_count,
-                               SUM(CASE WHEN "Education Level" = 'Primary (1-5)' THEN 1 ELSE 0 END) as primary_count,
-                               SUM(CASE WHEN "Education Level" = 'Upper Primary (6-8)' THEN 1 ELSE 0 END) as upper_primary_count,
-                               SUM(CASE WHEN "Education Level" = 'Secondary (9-10)' THEN 1 ELSE 0 END) as secondary_count,
-                               SUM(CASE WHEN "Education Level" = 'Sr. Secondary (11-12)' THEN 1 ELSE 0 END) as sr_secondary_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                    '''
-                else:
-                    block_query = f'''
-                        SELECT COUNT(*) as total_count,
-                               SUM(CASE WHEN "Gender" = '{FEMALE_VALUE}' THEN 1 ELSE 0 END) as female_count,
-                               SUM(CASE WHEN "Gender" = '{MALE_VALUE}' THEN 1 ELSE 0 END) as male_count,
-                               SUM(CASE WHEN "Education Level" = 'Primary (1-5)' THEN 1 ELSE 0 END) as primary_count,
-                               SUM(CASE WHEN "Education Level" = 'Upper Primary (6-8)' THEN 1 ELSE 0 END) as upper_primary_count,
-                               SUM(CASE WHEN "Education Level" = 'Secondary (9-10)' THEN 1 ELSE 0 END) as secondary_count,
-                               SUM(CASE WHEN "Education Level" = 'Sr. Secondary (11-12)' THEN 1 ELSE 0 END) as sr_secondary_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Academic Year" = '{block_year}'
-                    '''
-                
-                block_stats = con.execute(block_query).df().iloc[0]
-                
-                # Get school count
-                if block_year == "All":
-                    school_count_query = f'''
-                        SELECT COUNT(DISTINCT "Last School Name") as school_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                    '''
-                else:
-                    school_count_query = f'''
-                        SELECT COUNT(DISTINCT "Last School Name") as school_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Academic Year" = '{block_year}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                    '''
-                
-                school_count = int(con.execute(school_count_query).df().iloc[0]['school_count'])
+                block_stats, category_rows = load_block_stats(block_selected_district, block_selected_block, block_year)
+                school_count = block_stats['school_count']
                 
                 # Block Overview Card
-                total_students = int(block_stats['total_count'])
-                girls_count = int(block_stats['female_count'])
-                boys_count = int(block_stats['male_count'])
+                total_students = block_stats['total_count']
+                girls_count = block_stats['female_count']
+                boys_count = block_stats['male_count']
                 
                 # Calculate dropout rate (example - you can adjust this)
                 dropout_rate = 8.72  # Example static value, calculate from actual enrollment data
@@ -1996,67 +2545,33 @@ if st.session_state.active_tab == 2:
                     performance_status = "🔴 Needs Attention"
                     status_color = "#ff6b6b"
                 
-                st.markdown(f"""
-                <div style='background: linear-gradient(135deg, #fa709a 0%, #fee140 100%); 
-                            padding: 2rem; border-radius: 20px; 
-                            box-shadow: 0 10px 25px rgba(0,0,0,0.3);
-                            margin-bottom: 2rem;'>
-                    <h2 style='color: white; margin: 0 0 0.5rem 0; font-size: 2rem; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);'>
-                        🏘️ {block_selected_block}
-                    </h2>
-                    <p style='color: white; margin: 0; font-size: 1.1rem; opacity: 0.95;'>
-                        {block_selected_district} District | Academic Year: {block_year}
-                    </p>
-                    <div style='margin-top: 1.5rem; display: flex; justify-content: space-between; align-items: center;'>
-                        <div>
-                            <p style='color: white; margin: 0; font-size: 0.9rem; opacity: 0.9;'>Total Blocks</p>
-                            <p style='color: white; margin: 0; font-size: 1.5rem; font-weight: bold;'>85/17 blocks</p>
-                        </div>
-                        <div>
-                            <p style='color: white; margin: 0; font-size: 0.9rem; opacity: 0.9;'>Dropout Rate</p>
-                            <p style='color: white; margin: 0; font-size: 1.5rem; font-weight: bold;'>{dropout_rate}%</p>
-                        </div>
-                        <div>
-                            <p style='color: white; margin: 0; font-size: 0.9rem; opacity: 0.9;'>Status</p>
-                            <p style='color: {status_color}; margin: 0; font-size: 1.3rem; font-weight: bold;'>{performance_status}</p>
-                        </div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Metric boxes - 7 columns
-                col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
+                st.markdown(BLOCK_OVERVIEW_CARD.format(
+                    block=block_selected_block, district=block_selected_district, year=block_year,
+                    dropout_rate=dropout_rate, status_color=status_color, performance_status=performance_status
+                ), unsafe_allow_html=True)
                 
+                # Metric boxes - all 7 cards in one grid
                 metrics = [
-                    ("📊 Total Dropouts", total_students, col1, "#ff6b6b", "#ee5a6f"),
-                    ("👧 Girls", girls_count, col2, "#fa709a", "#fee140"),
-                    ("👦 Boys", boys_count, col3, "#4facfe", "#00f2fe"),
-                    ("🎒 Primary", int(block_stats['primary_count']), col4, "#43e97b", "#38f9d7"),
-                    ("📚 Upper Primary", int(block_stats['upper_primary_count']), col5, "#fa8bff", "#2bd2ff"),
-                    ("🎓 Secondary", int(block_stats['secondary_count']), col6, "#fccb90", "#d57eeb"),
-                    ("🏆 Higher Secondary", int(block_stats['sr_secondary_count']), col7, "#a8edea", "#fed6e3")
+                    ("📊 Total Dropouts", total_students, "#ff6b6b", "#ee5a6f"),
+                    ("👧 Girls", girls_count, "#fa709a", "#fee140"),
+                    ("👦 Boys", boys_count, "#4facfe", "#00f2fe"),
+                    ("🎒 Primary", block_stats['primary_count'], "#43e97b", "#38f9d7"),
+                    ("📚 Upper Primary", block_stats['upper_primary_count'], "#fa8bff", "#2bd2ff"),
+                    ("🎓 Secondary", block_stats['secondary_count'], "#fccb90", "#d57eeb"),
+                    ("🏆 Higher Secondary", block_stats['sr_secondary_count'], "#a8edea", "#fed6e3")
                 ]
                 
-                for title, value, column, color1, color2 in metrics:
-                    with column:
-                        st.markdown(f"""
-                        <div style='background: linear-gradient(135deg, {color1}, {color2}); 
-                                    padding: 1.8rem; border-radius: 15px; text-align: center; 
-                                    box-shadow: 0 8px 16px rgba(0,0,0,0.2); height: 150px; 
-                                    display: flex; flex-direction: column; justify-content: center;'>
-                            <h3 style='color: white; margin: 0; font-size: 1rem; text-shadow: 1px 1px 2px rgba(0,0,0,0.2);'>{title}</h3>
-                            <p style='color: white; font-size: 2.2rem; font-weight: bold; margin: 0.5rem 0 0 0; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);'>{value:,}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                
-                st.markdown("<br><br>", unsafe_allow_html=True)
+                metric_cards = "".join(
+                    BLOCK_METRIC_CARD.format(title=title, value=f"{value:,}", color1=color1, color2=color2)
+                    for title, value, color1, color2 in metrics
+                )
+                st.markdown(
+                    f"<div style='display: grid; grid-template-columns: repeat(auto-fit, minmax(140px, 1fr)); gap: 1rem;'>{metric_cards}</div>",
+                    unsafe_allow_html=True
+                )
                 
                 # ==================== BLOCK PERFORMANCE SCORECARD ====================
-                st.markdown("""
-                <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                    📊 Block Performance Scorecard
-                </h3>
-                """, unsafe_allow_html=True)
+                st.markdown(BLOCK_SECTION_HEADER.format(title="📊 Block Performance Scorecard"), unsafe_allow_html=True)
                 
                 col_score1, col_score2 = st.columns(2)
                 
@@ -2079,91 +2594,34 @@ if st.session_state.active_tab == 2:
                         score_label = "🔴 Needs Improvement"
                         score_color = "#ff6b6b"
                     
-                    st.markdown(f"""
-                    <div style='background: linear-gradient(135deg, #667eea, #764ba2); 
-                                padding: 2.5rem; border-radius: 15px; text-align: center; 
-                                box-shadow: 0 8px 16px rgba(0,0,0,0.2); height: 100%;'>
-                        <h4 style='color: white; margin: 0; font-size: 1.3rem;'>Overall Score</h4>
-                        <h1 style='color: {score_color}; font-size: 5rem; margin: 1.5rem 0; font-weight: bold; text-shadow: 3px 3px 6px rgba(0,0,0,0.3);'>{overall_score}<span style='font-size: 2.5rem;'>/100</span></h1>
-                        <p style='color: white; font-size: 1.6rem; margin: 0; font-weight: bold;'>{score_label}</p>
-                        <p style='color: rgba(255,255,255,0.7); font-size: 0.75rem; margin-top: 1rem; line-height: 1.4;'>
-                            Score: <strong>&lt;1000=90</strong> | <strong>1000-3000=70</strong> | <strong>3000-5000=50</strong> | <strong>&gt;5000=30</strong>
-                        </p>
-                    </div>
-                    """, unsafe_allow_html=True)
+                    st.markdown(BLOCK_SCORE_CARD.format(
+                        score_color=score_color, overall_score=overall_score, score_label=score_label
+                    ), unsafe_allow_html=True)
                 
                 with col_score2:
                     # Calculate metrics
                     retention_rate = 100 - dropout_rate
-                    gender_parity = round(girls_count / boys_count, 2) if boys_count > 0 else 0
+                    gender_parity = block_stats['gender_parity']
                     
-                    st.markdown(f"""
-                    <div style='background: rgba(255,255,255,0.1); 
-                                padding: 1.5rem; border-radius: 15px;
-                                box-shadow: 0 8px 16px rgba(0,0,0,0.2); height: 100%;'>
-                        <div style='margin-bottom: 1rem; padding: 1rem; background: rgba(67,230,123,0.2); border-radius: 10px; border-left: 4px solid #43e97b;'>
-                            <span style='color: white; font-size: 1.1rem;'>✅ Retention Rate:</span>
-                            <span style='color: #43e97b; font-size: 1.5rem; font-weight: bold; float: right;'>{retention_rate:.1f}%</span>
-                        </div>
-                        <div style='margin-bottom: 1rem; padding: 1rem; background: rgba(250,112,154,0.2); border-radius: 10px; border-left: 4px solid #fa709a;'>
-                            <span style='color: white; font-size: 1.1rem;'>👧 Gender Parity:</span>
-                            <span style='color: #fa709a; font-size: 1.5rem; font-weight: bold; float: right;'>{gender_parity}</span>
-                        </div>
-                        <div style='margin-bottom: 1rem; padding: 1rem; background: rgba(79,172,254,0.2); border-radius: 10px; border-left: 4px solid #4facfe;'>
-                            <span style='color: white; font-size: 1.1rem;'>🏫 Total Schools:</span>
-                            <span style='color: #4facfe; font-size: 1.5rem; font-weight: bold; float: right;'>{school_count}</span>
-                        </div>
-                        <div style='padding: 1rem; background: rgba(252,203,144,0.2); border-radius: 10px; border-left: 4px solid #fccb90;'>
-                            <span style='color: white; font-size: 1.1rem;'>📈 Trend:</span>
-                            <span style='color: #43e97b; font-size: 1.5rem; font-weight: bold; float: right;'>↑ Improving</span>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                st.markdown("<br><br>", unsafe_allow_html=True)
+                    st.markdown(BLOCK_KPI_PANEL.format(
+                        retention_rate=retention_rate, gender_parity=gender_parity, school_count=school_count
+                    ), unsafe_allow_html=True)
                 
                 # ==================== ALERTS & RECOMMENDATIONS ====================
-                st.markdown("""
-                <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                    ⚠️ Alerts & Recommendations
-                </h3>
-                """, unsafe_allow_html=True)
+                st.markdown(BLOCK_SECTION_HEADER.format(title="⚠️ Alerts & Recommendations"), unsafe_allow_html=True)
                 
                 col_alert1, col_alert2 = st.columns(2)
                 
                 with col_alert1:
                     # Calculate critical metrics
-                    girls_percentage = (girls_count / total_students * 100) if total_students > 0 else 0
+                    girls_percentage = block_stats['girls_pct']
+                    primary_percentage = block_stats['primary_pct']
                     
-                    st.markdown(f"""
-                    <div style='background: rgba(255,107,107,0.2); 
-                                padding: 1.8rem; border-radius: 15px; border-left: 5px solid #ff6b6b;
-                                box-shadow: 0 8px 16px rgba(0,0,0,0.2); margin-bottom: 1.5rem;'>
-                        <h4 style='color: #ff6b6b; margin: 0 0 1.2rem 0; font-size: 1.3rem; font-weight: bold;'>🔴 Critical Alerts</h4>
-                        <ul style='color: white; font-size: 1rem; line-height: 2; margin: 0; padding-left: 1.5rem;'>
-                            <li><strong>High Dropout Rate:</strong> {dropout_rate}% above district average</li>
-                            <li><strong>Gender Gap:</strong> Girls {girls_percentage:.1f}% of total dropouts</li>
-                            <li><strong>Secondary Level:</strong> {int(block_stats['secondary_count'])} students at risk</li>
-                            <li><strong>Critical Schools:</strong> Top 5 schools need intervention</li>
-                        </ul>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    primary_percentage = (int(block_stats['primary_count']) / total_students * 100) if total_students > 0 else 0
-                    
-                    st.markdown(f"""
-                    <div style='background: rgba(67,230,123,0.2); 
-                                padding: 1.8rem; border-radius: 15px; border-left: 5px solid #43e97b;
-                                box-shadow: 0 8px 16px rgba(0,0,0,0.2);'>
-                        <h4 style='color: #43e97b; margin: 0 0 1.2rem 0; font-size: 1.3rem; font-weight: bold;'>✅ Positive Trends</h4>
-                        <ul style='color: white; font-size: 1rem; line-height: 2; margin: 0; padding-left: 1.5rem;'>
-                            <li><strong>Primary Level:</strong> {primary_percentage:.1f}% retention improving</li>
-                            <li><strong>School Coverage:</strong> {school_count} schools in monitoring</li>
-                            <li><strong>Data Quality:</strong> 95% records complete</li>
-                            <li><strong>Improvement:</strong> 1.2% decrease from last year</li>
-                        </ul>
-                    </div>
-                    """, unsafe_allow_html=True)
+                    st.markdown(BLOCK_ALERT_CARDS.format(
+                        dropout_rate=dropout_rate, girls_percentage=girls_percentage,
+                        secondary_count=block_stats['secondary_count'],
+                        primary_percentage=primary_percentage, school_count=school_count
+                    ), unsafe_allow_html=True)
                 
                 with col_alert2:
                     st.markdown("""
@@ -2179,9 +2637,6 @@ if st.session_state.active_tab == 2:
                             <li><strong>Monthly Monitoring:</strong> Track attendance patterns</li>
                         </ol>
                     </div>
-                    """, unsafe_allow_html=True)
-                    
-                    st.markdown("""
                     <div style='background: rgba(79,172,254,0.2); 
                                 padding: 1.8rem; border-radius: 15px; border-left: 5px solid #4facfe;
                                 box-shadow: 0 8px 16px rgba(0,0,0,0.2);'>
@@ -2208,44 +2663,9 @@ if st.session_state.active_tab == 2:
                     </h3>
                     """, unsafe_allow_html=True)
                     
-                    gender_data = pd.DataFrame({
-                        'Gender': ['Girls', 'Boys'],
-                        'Count': [girls_count, boys_count]
-                    })
-                    
-                    fig_gender = px.pie(
-                        gender_data,
-                        values='Count',
-                        names='Gender',
-                        color='Gender',
-                        color_discrete_map={'Girls': '#fa709a', 'Boys': '#4facfe'},
-                        hole=0.4
-                    )
-                    
-                    fig_gender.update_traces(
-                        textposition='inside',
-                        textinfo='percent+label',
-                        textfont_size=14,
-                        marker=dict(line=dict(color='white', width=2))
-                    )
-                    
-                    fig_gender.update_layout(
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        font=dict(color='white', size=14),
-                        height=400,
-                        showlegend=True,
-                        legend=dict(
-                            orientation="h",
-                            yanchor="bottom",
-                            y=-0.2,
-                            xanchor="center",
-                            x=0.5,
-                            font=dict(size=13)
-                        )
-                    )
-                    
-                    st.plotly_chart(fig_gender, use_container_width=True, config={'displayModeBar': False})
+                    fig_gender = build_block_gender_fig(girls_count, boys_count)
+                    st.plotly_chart(fig_gender, use_container_width=True, config={'displayModeBar': False},
+                                    key=f"block_gender_{block_selected_district}_{block_selected_block}_{block_year}")
                 
                 with col_chart2:
                     st.markdown("""
@@ -2254,175 +2674,33 @@ if st.session_state.active_tab == 2:
                     </h3>
                     """, unsafe_allow_html=True)
                     
-                    edu_data = pd.DataFrame({
-                        'Level': ['Primary', 'Upper Primary', 'Secondary', 'Sr. Secondary'],
-                        'Count': [
-                            int(block_stats['primary_count']),
-                            int(block_stats['upper_primary_count']),
-                            int(block_stats['secondary_count']),
-                            int(block_stats['sr_secondary_count'])
-                        ]
-                    })
-                    
-                    fig_edu = px.bar(
-                        edu_data,
-                        x='Level',
-                        y='Count',
-                        color='Count',
-                        color_continuous_scale='Viridis',
-                        text='Count'
-                    )
-                    
-                    fig_edu.update_traces(
-                        texttemplate='%{text:,}',
-                        textposition='outside',
-                        textfont=dict(size=13, color='white')
-                    )
-                    
-                    fig_edu.update_layout(
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        font=dict(color='white', size=14),
-                        xaxis=dict(
-                            title='',
-                            showgrid=False,
-                            tickfont=dict(size=16, color='white', family='Arial Black')
-                        ),
-                        yaxis=dict(
-                            title='Student Count',
-                            showgrid=True,
-                            gridcolor='rgba(255,255,255,0.1)',
-                            tickfont=dict(size=16, color='white', family='Arial Black'),
-                            title_font=dict(size=16, color='white', family='Arial Black')
-                        ),
-                        height=400,
-                        showlegend=False
+                    fig_edu = build_block_edu_fig(
+                        block_stats['primary_count'], block_stats['upper_primary_count'],
+                        block_stats['secondary_count'], block_stats['sr_secondary_count']
                     )
-                    
-                    st.plotly_chart(fig_edu, use_container_width=True, config={'displayModeBar': False})
-                
-                st.markdown("<br><br>", unsafe_allow_html=True)
+                    st.plotly_chart(fig_edu, use_container_width=True, config={'displayModeBar': False},
+                                    key=f"block_edu_{block_selected_district}_{block_selected_block}_{block_year}")
                 
                 # ==================== SCHOOL CATEGORY ANALYSIS ====================
-                st.markdown("""
-                <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                    🏫 School Category Analysis
-                </h3>
-                """, unsafe_allow_html=True)
+                st.markdown(BLOCK_SECTION_HEADER.format(title="🏫 School Category Analysis"), unsafe_allow_html=True)
                 
-                # Get school category breakdown
-                if block_year == "All":
-                    category_query = f'''
-                        SELECT "School Category", COUNT(*) as count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "School Category" IS NOT NULL
-                        AND "School Category" != ''
-                        GROUP BY "School Category"
-                        ORDER BY count DESC
-                    '''
-                else:
-                    category_query = f'''
-                        SELECT "School Category", COUNT(*) as count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Academic Year" = '{block_year}'
-                        AND "School Category" IS NOT NULL
-                        AND "School Category" != ''
-                        GROUP BY "School Category"
-                        ORDER BY count DESC
-                    '''
-                
-                category_data = con.execute(category_query).df()
-                
-                if not category_data.empty:
-                    fig_category = go.Figure(go.Bar(
-                        x=category_data['count'],
-                        y=category_data['School Category'],
-                        orientation='h',
-                        marker=dict(
-                            color=category_data['count'],
-                            colorscale='Turbo',
-                            showscale=True,
-                            colorbar=dict(
-                                title=dict(text="Students", font=dict(size=14, color='white')),
-                                tickfont=dict(color='white')
-                            )
-                        ),
-                        text=category_data['count'],
-                        textposition='outside',
-                        texttemplate='%{text:,}',
-                        textfont=dict(size=13, color='white'),
-                        hovertemplate='<b>%{y}</b><br>Dropouts: %{x:,}<extra></extra>'
-                    ))
-                    
-                    fig_category.update_layout(
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        paper_bgcolor='rgba(0,0,0,0)',
-                        font=dict(color='white', size=14),
-                        xaxis=dict(
-                            title='Dropout Count',
-                            showgrid=True,
-                            gridcolor='rgba(255,255,255,0.1)',
-                            tickfont=dict(size=16, color='white', family='Arial Black'),
-                            title_font=dict(size=16, color='white', family='Arial Black')
-                        ),
-                        yaxis=dict(
-                            title='',
-                            showgrid=False,
-                            tickfont=dict(size=16, color='white', family='Arial Black')
-                        ),
-                        height=400,
-                        margin=dict(l=250, r=50, t=50, b=50),
-                        hoverlabel=dict(bgcolor="white", font_size=14)
-                    )
-                    
-                    st.plotly_chart(fig_category, use_container_width=True, config={'displayModeBar': False})
+                # School category breakdown comes from the block query above
+                if category_rows:
+                    fig_category = build_block_category_fig(tuple(category_rows))
+                    st.plotly_chart(fig_category, use_container_width=True, config={'displayModeBar': False},
+                                    key=f"block_category_{block_selected_district}_{block_selected_block}_{block_year}")
                 else:
                     st.info("📊 School category data not available")
                 
-                st.markdown("<br><br>", unsafe_allow_html=True)
-                
                 # ==================== SCHOOL PERFORMANCE ====================
-                st.markdown("""
-                <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                    🏆 School Performance Rankings
-                </h3>
-                """, unsafe_allow_html=True)
+                st.markdown(BLOCK_SECTION_HEADER.format(title="🏆 School Performance Rankings"), unsafe_allow_html=True)
                 
                 col_perf1, col_perf2 = st.columns(2)
                 
-                # Top 5 Schools (Highest Dropouts)
-                if block_year == "All":
-                    top_schools_query = f'''
-                        SELECT "Last School Name" as school_name, COUNT(*) as dropout_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                        GROUP BY "Last School Name"
-                        ORDER BY dropout_count DESC
-                        LIMIT 5
-                    '''
-                else:
-                    top_schools_query = f'''
-                        SELECT "Last School Name" as school_name, COUNT(*) as dropout_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Academic Year" = '{block_year}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                        GROUP BY "Last School Name"
-                        ORDER BY dropout_count DESC
-                        LIMIT 5
-                    '''
-                
-                top_schools = con.execute(top_schools_query).df()
+                # One cached school-wise aggregation feeds the top/bottom 5 lists and the detailed table
+                all_schools_df, top_schools, bottom_schools = load_block_schools(block_selected_district, block_selected_block, block_year)
                 
+                # Top 5 Schools (Highest Dropouts)
                 with col_perf1:
                     st.markdown("""
                     <h4 style='color: #ff6b6b; text-align: center; font-size: 1.3rem; margin-bottom: 1rem; font-weight: bold;'>
@@ -2431,54 +2709,15 @@ if st.session_state.active_tab == 2:
                     """, unsafe_allow_html=True)
                     
                     if not top_schools.empty:
-                        for idx, row in top_schools.iterrows():
-                            st.markdown(f"""
-                            <div style='background: rgba(255,107,107,0.2); 
-                                        padding: 1rem; margin-bottom: 0.8rem; border-radius: 10px;
-                                        border-left: 4px solid #ff6b6b;
-                                        box-shadow: 0 4px 8px rgba(0,0,0,0.2);'>
-                                <div style='display: flex; justify-content: space-between; align-items: center;'>
-                                    <span style='color: white; font-size: 0.95rem; flex: 1;'>
-                                        {idx + 1}. {row['school_name'][:50]}...
-                                    </span>
-                                    <span style='color: #ff6b6b; font-size: 1.3rem; font-weight: bold;'>
-                                        {row['dropout_count']:,}
-                                    </span>
-                                </div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                        st.markdown("<div>" + "".join(
+                            BLOCK_SCHOOL_CARD.format(background='rgba(255,107,107,0.2)', accent='#ff6b6b',
+                                                     rank=rank, school_name=row.school_name[:50], count=row.total_dropouts)
+                            for rank, row in enumerate(top_schools.itertuples(index=False), start=1)
+                        ) + "</div>", unsafe_allow_html=True)
                     else:
                         st.info("📊 No data available")
                 
                 # Bottom 5 Schools (Lowest Dropouts)
-                if block_year == "All":
-                    bottom_schools_query = f'''
-                        SELECT "Last School Name" as school_name, COUNT(*) as dropout_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                        GROUP BY "Last School Name"
-                        ORDER BY dropout_count ASC
-                        LIMIT 5
-                    '''
-                else:
-                    bottom_schools_query = f'''
-                        SELECT "Last School Name" as school_name, COUNT(*) as dropout_count
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Academic Year" = '{block_year}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                        GROUP BY "Last School Name"
-                        ORDER BY dropout_count ASC
-                        LIMIT 5
-                    '''
-                
-                bottom_schools = con.execute(bottom_schools_query).df()
-                
                 with col_perf2:
                     st.markdown("""
                     <h4 style='color: #43e97b; text-align: center; font-size: 1.3rem; margin-bottom: 1rem; font-weight: bold;'>
@@ -2487,73 +2726,19 @@ if st.session_state.active_tab == 2:
                     """, unsafe_allow_html=True)
                     
                     if not bottom_schools.empty:
-                        for idx, row in bottom_schools.iterrows():
-                            st.markdown(f"""
-                            <div style='background: rgba(67,230,123,0.2); 
-                                        padding: 1rem; margin-bottom: 0.8rem; border-radius: 10px;
-                                        border-left: 4px solid #43e97b;
-                                        box-shadow: 0 4px 8px rgba(0,0,0,0.2);'>
-                                <div style='display: flex; justify-content: space-between; align-items: center;'>
-                                    <span style='color: white; font-size: 0.95rem; flex: 1;'>
-                                        {idx + 1}. {row['school_name'][:50]}...
-                                    </span>
-                                    <span style='color: #43e97b; font-size: 1.3rem; font-weight: bold;'>
-                                        {row['dropout_count']:,}
-                                    </span>
-                                </div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                        st.markdown("<div>" + "".join(
+                            BLOCK_SCHOOL_CARD.format(background='rgba(67,230,123,0.2)', accent='#43e97b',
+                                                     rank=rank, school_name=row.school_name[:50], count=row.total_dropouts)
+                            for rank, row in enumerate(bottom_schools.itertuples(index=False), start=1)
+                        ) + "</div>", unsafe_allow_html=True)
                     else:
                         st.info("📊 No data available")
                 
-                st.markdown("<br><br>", unsafe_allow_html=True)
-                
                 # ==================== DETAILED SCHOOL TABLE ====================
-                st.markdown("""
-                <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                    📋 Detailed School-wise Data Table
-                </h3>
-                """, unsafe_allow_html=True)
+                st.markdown(BLOCK_SECTION_HEADER.format(title="📋 Detailed School-wise Data Table"), unsafe_allow_html=True)
                 
-                # Get all schools data
-                if block_year == "All":
-                    all_schools_query = f'''
-                        SELECT "Last School Name" as school_name,
-                               "School Category" as category,
-                               COUNT(*) as total_dropouts,
-                               SUM(CASE WHEN "Gender" = '{FEMALE_VALUE}' THEN 1 ELSE 0 END) as girls,
-                               SUM(CASE WHEN "Gender" = '{MALE_VALUE}' THEN 1 ELSE 0 END) as boys
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                        GROUP BY "Last School Name", "School Category"
-                        ORDER BY total_dropouts DESC
-                    '''
-                else:
-                    all_schools_query = f'''
-                        SELECT "Last School Name" as school_name,
-                               "School Category" as category,
-                               COUNT(*) as total_dropouts,
-                               SUM(CASE WHEN "Gender" = '{FEMALE_VALUE}' THEN 1 ELSE 0 END) as girls,
-                               SUM(CASE WHEN "Gender" = '{MALE_VALUE}' THEN 1 ELSE 0 END) as boys
-                        FROM "{csv_file}"
-                        WHERE "District Name" = '{block_selected_district}'
-                        AND "Block Name" = '{block_selected_block}'
-                        AND "Academic Year" = '{block_year}'
-                        AND "Last School Name" IS NOT NULL
-                        AND "Last School Name" != ''
-                        GROUP BY "Last School Name", "School Category"
-                        ORDER BY total_dropouts DESC
-                    '''
-                
-                all_schools_df = con.execute(all_schools_query).df()
                 
                 if not all_schools_df.empty:
-                    # Add rank column
-                    all_schools_df.insert(0, 'Rank', range(1, len(all_schools_df) + 1))
-                    
                     # Display with custom styling
                     st.dataframe(
                         all_schools_df,
@@ -2577,24 +2762,17 @@ if st.session_state.active_tab == 2:
                 else:
                     st.info("📊 No school data available")
                 
-                st.markdown("<br><br>", unsafe_allow_html=True)
-                
                 # ==================== DOWNLOAD OPTIONS ====================
-                st.markdown("""
-                <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                    📥 Download Options
-                </h3>
-                """, unsafe_allow_html=True)
+                st.markdown(BLOCK_SECTION_HEADER.format(title="📥 Download Options"), unsafe_allow_html=True)
                 
                 col_d1, col_d2, col_d3 = st.columns(3)
                 
                 with col_d1:
                     if st.button("📊 Download School Summary (CSV)", use_container_width=True, type="primary"):
                         if not all_schools_df.empty:
-                            csv = all_schools_df.to_csv(index=False).encode('utf-8')
                             st.download_button(
                                 label="⬇️ Download CSV",
-                                data=csv,
+                                data=get_block_schools_csv(block_selected_district, block_selected_block, block_year),
                                 file_name=f"{block_selected_block}_school_summary.csv",
                                 mime="text/csv",
                                 use_container_width=True
@@ -2615,6 +2793,9 @@ if st.session_state.active_tab == 2:
                 st.error(f"❌ Error loading data: {str(e)}")
                 import traceback
                 st.code(traceback.format_exc())
+    
+    if block_selected_district != "Select" and block_selected_block != "Select":
+        render_block_panel(block_year, block_selected_district, block_selected_block)
     else:
         st.info("👆 कृपया ऊपर से जिला और ब्लॉक चुनें।")
 
@@ -2632,195 +2813,106 @@ elif st.session_state.active_tab == 3:
     
     with col_f2:
         st.markdown("### 🗺️ District")
-        if school_year == "All":
-            districts_query = f'SELECT DISTINCT "District Name" FROM "{csv_file}" ORDER BY "District Name"'
-        else:
-            districts_query = f'SELECT DISTINCT "District Name" FROM "{csv_file}" WHERE "Academic Year" = \'{school_year}\' ORDER BY "District Name"'
-        
-        school_districts = con.execute(districts_query).df()['District Name'].tolist()
+        school_districts = get_districts(school_year)
         school_selected_district = st.selectbox("District:", ["All"] + school_districts, key="school_district_filter", label_visibility="collapsed")
     
     with col_f3:
         st.markdown("### 🏘️ Block")
-        # Get blocks based on year and district filters
-        if school_year == "All" and school_selected_district == "All":
-            blocks_query = f'SELECT DISTINCT "Block Name" FROM "{csv_file}" WHERE "Block Name" IS NOT NULL AND "Block Name" != \'\' ORDER BY "Block Name"'
-        elif school_year == "All":
-            blocks_query = f'SELECT DISTINCT "Block Name" FROM "{csv_file}" WHERE "District Name" = \'{school_selected_district}\' AND "Block Name" IS NOT NULL AND "Block Name" != \'\' ORDER BY "Block Name"'
-        elif school_selected_district == "All":
-            blocks_query = f'SELECT DISTINCT "Block Name" FROM "{csv_file}" WHERE "Academic Year" = \'{school_year}\' AND "Block Name" IS NOT NULL AND "Block Name" != \'\' ORDER BY "Block Name"'
-        else:
-            blocks_query = f'SELECT DISTINCT "Block Name" FROM "{csv_file}" WHERE "Academic Year" = \'{school_year}\' AND "District Name" = \'{school_selected_district}\' AND "Block Name" IS NOT NULL AND "Block Name" != \'\' ORDER BY "Block Name"'
-        
-        school_blocks = con.execute(blocks_query).df()['Block Name'].tolist()
+        school_blocks = get_blocks(school_year, school_selected_district)
         school_selected_block = st.selectbox("Block:", ["All"] + school_blocks, key="school_block_filter", label_visibility="collapsed")
     
     with col_f4:
         st.markdown("### 🔍 Search School")
-        # Get all schools based on filters (Year, District, Block)
-        filters = []
-        if school_year != "All":
-            filters.append(f'"Academic Year" = \'{school_year}\'')
-        if school_selected_district != "All":
-            filters.append(f'"District Name" = \'{school_selected_district}\'')
-        if school_selected_block != "All":
-            filters.append(f'"Block Name" = \'{school_selected_block}\'')
-        
-        where_clause = " AND ".join(filters) if filters else "1=1"
-        schools_query = f'''
-            SELECT DISTINCT "Last School Name" 
-            FROM "{csv_file}" 
-            WHERE {where_clause} 
-            AND "Last School Name" IS NOT NULL 
-            AND "Last School Name" != \'\' 
-            ORDER BY "Last School Name"
-        '''
-        
-        schools_list = con.execute(schools_query).df()['Last School Name'].tolist()
+        # The statewide school list is too long for a dropdown - list schools once a district or block is picked
+        if school_selected_district != "All" or school_selected_block != "All":
+            schools_list = get_schools(school_year, school_selected_district, school_selected_block)
+        else:
+            schools_list = []
         selected_school = st.selectbox("School Name:", ["-- Select School --"] + schools_list, key="school_selector", label_visibility="collapsed")
+        if not schools_list:
+            st.caption("Select a district or block first to list its schools")
     
     st.markdown("<br>", unsafe_allow_html=True)
     
     if selected_school != "-- Select School --":
         with st.spinner('📊 Loading school data...'):
             try:
-                # Build filters for school data query
-                filters = [f'"Last School Name" = \'{selected_school}\'']
-                
-                if school_year != "All":
-                    filters.append(f'"Academic Year" = \'{school_year}\'')
-                if school_selected_district != "All":
-                    filters.append(f'"District Name" = \'{school_selected_district}\'')
-                if school_selected_block != "All":
-                    filters.append(f'"Block Name" = \'{school_selected_block}\'')
-                
-                where_clause = " AND ".join(filters)
-                
-                school_data_query = f'''
-                    SELECT *
-                    FROM "{csv_file}"
-                    WHERE {where_clause}
+                # Bound to the ? markers below - 'All' switches a filter off
+                school_filter_params = [school_year, school_year,
+                                        school_selected_district, school_selected_district,
+                                        school_selected_block, school_selected_block]
+                # School metadata, counters and its dropout rank within its block in one row -
+                # the ranking CTE reads the block picked by the school's own row
+                school_stats_query = '''
+                    WITH school AS (
+                        SELECT COUNT(*) as total_dropouts,
+                               COUNT(*) FILTER (WHERE gender_code = 1) as girls,
+                               COUNT(*) FILTER (WHERE gender_code = 2) as boys,
+                               COUNT(*) FILTER (WHERE edu_code = 1) as primary_count,
+                               COUNT(*) FILTER (WHERE edu_code = 2) as upper_primary_count,
+                               COUNT(*) FILTER (WHERE edu_code = 3) as secondary_count,
+                               COUNT(*) FILTER (WHERE edu_code = 4) as sr_secondary_count,
+                               COALESCE(mode("School Category"), 'N/A') as school_category,
+                               COALESCE(mode("School Management"), 'N/A') as school_management,
+                               first("District Name") as district_name,
+                               COALESCE(first("Block Name"), 'N/A') as block_name
+                        FROM dropouts
+                        WHERE "Last School Name" = ?
+                        AND (? = 'All' OR "Academic Year" = ?)
+                        AND (? = 'All' OR "District Name" = ?)
+                        AND (? = 'All' OR "Block Name" = ?)
+                    ),
+                    block_ranking AS (
+                        SELECT "Last School Name",
+                               ROW_NUMBER() OVER (ORDER BY SUM(count) DESC, "Last School Name") as rank,
+                               COUNT(*) OVER () as school_count
+                        FROM school_summary
+                        WHERE "Block Name" = (SELECT block_name FROM school)
+                        AND (? = 'All' OR "Academic Year" = ?)
+                        GROUP BY "Last School Name"
+                    )
+                    SELECT school.*, ranked.rank as school_rank, COALESCE(ranked.school_count, 0) as block_school_count
+                    FROM school
+                    LEFT JOIN block_ranking ranked ON ranked."Last School Name" = ?
                 '''
                 
-                school_df = con.execute(school_data_query).df()
+                (total_dropouts, girls_dropouts, boys_dropouts,
+                 primary_count, upper_primary_count, secondary_count, sr_secondary_count,
+                 school_category, school_management, district_name, block_name,
+                 school_rank, total_schools_in_block) = con.execute(
+                    school_stats_query,
+                    [selected_school] + school_filter_params + [school_year, school_year, selected_school]
+                ).fetchone()
                 
-                if not school_df.empty:
-                    # Get school metadata
+                if total_dropouts:
                     school_name = selected_school
-                    school_category = school_df['School Category'].mode()[0] if 'School Category' in school_df.columns else "N/A"
-                    school_management = school_df['School Management'].mode()[0] if 'School Management' in school_df.columns else "N/A"
-                    district_name = school_df['District Name'].iloc[0]
-                    block_name = school_df['Block Name'].iloc[0] if 'Block Name' in school_df.columns else "N/A"
-                    
-                    # Calculate metrics
-                    total_dropouts = len(school_df)
-                    girls_dropouts = len(school_df[school_df['Gender'] == FEMALE_VALUE])
-                    boys_dropouts = len(school_df[school_df['Gender'] == MALE_VALUE])
-                    
-                    # Education level breakdown
-                    primary_count = len(school_df[school_df['Education Level'] == 'Primary (1-5)'])
-                    upper_primary_count = len(school_df[school_df['Education Level'] == 'Upper Primary (6-8)'])
-                    secondary_count = len(school_df[school_df['Education Level'] == 'Secondary (9-10)'])
-                    sr_secondary_count = len(school_df[school_df['Education Level'] == 'Sr. Secondary (11-12)'])
-                    
-                    # Calculate ranking in block
-                    if school_year == "All":
-                        block_ranking_query = f'''
-                            SELECT "Last School Name", COUNT(*) as dropout_count
-                            FROM "{csv_file}"
-                            WHERE "Block Name" = '{block_name}'
-                            AND "Last School Name" IS NOT NULL
-                            AND "Last School Name" != ''
-                            GROUP BY "Last School Name"
-                            ORDER BY dropout_count DESC
-                        '''
-                    else:
-                        block_ranking_query = f'''
-                            SELECT "Last School Name", COUNT(*) as dropout_count
-                            FROM "{csv_file}"
-                            WHERE "Block Name" = '{block_name}'
-                            AND "Academic Year" = '{school_year}'
-                            AND "Last School Name" IS NOT NULL
-                            AND "Last School Name" != ''
-                            GROUP BY "Last School Name"
-                            ORDER BY dropout_count DESC
-                        '''
-                    
-                    block_ranking_df = con.execute(block_ranking_query).df()
-                    school_rank_in_block = block_ranking_df[block_ranking_df['Last School Name'] == school_name].index[0] + 1 if school_name in block_ranking_df['Last School Name'].values else "N/A"
-                    total_schools_in_block = len(block_ranking_df)
+                    school_rank_in_block = school_rank if school_rank is not None else "N/A"
                     
                     # SCHOOL OVERVIEW CARD
-                    st.markdown(f"""
-                    <div style='background: linear-gradient(135deg, #1e3c72, #2a5298); 
-                                padding: 2rem; 
-                                border-radius: 20px; 
-                                box-shadow: 0 10px 30px rgba(0,0,0,0.4);
-                                margin-bottom: 2rem;
-                                border: 2px solid rgba(255,255,255,0.2);'>
-                        <h2 style='color: white; margin: 0 0 1.5rem 0; font-size: 2rem; font-weight: bold; text-shadow: 2px 2px 4px rgba(0,0,0,0.3);'>
-                            🏫 {school_name}
-                        </h2>
-                        <div style='display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1.5rem;'>
-                            <div>
-                                <p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>📍 District</p>
-                                <p style='color: white; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{district_name}</p>
-                            </div>
-                            <div>
-                                <p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏘️ Block</p>
-                                <p style='color: white; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{block_name}</p>
-                            </div>
-                            <div>
-                                <p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏷️ Category</p>
-                                <p style='color: #ffd700; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{school_category}</p>
-                            </div>
-                            <div>
-                                <p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏛️ Management</p>
-                                <p style='color: #ffd700; font-size: 1.2rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{school_management}</p>
-                            </div>
-                            <div>
-                                <p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>📊 Total Dropouts</p>
-                                <p style='color: #ff6b6b; font-size: 1.8rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{total_dropouts:,}</p>
-                            </div>
-                            <div>
-                                <p style='color: rgba(255,255,255,0.7); font-size: 0.9rem; margin: 0;'>🏆 Block Rank</p>
-                                <p style='color: #43e97b; font-size: 1.8rem; margin: 0.3rem 0 0 0; font-weight: bold;'>{school_rank_in_block}/{total_schools_in_block}</p>
-                            </div>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # METRICS ROW
-                    st.markdown("""
-                    <h3 style='color: white; text-align: center; font-size: 1.8rem; margin: 2rem 0 1.5rem 0; font-weight: bold;'>
-                        📊 Dropout Breakdown
-                    </h3>
-                    """, unsafe_allow_html=True)
-                    
-                    col_m1, col_m2, col_m3, col_m4, col_m5, col_m6 = st.columns(6)
+                    st.markdown(SCHOOL_OVERVIEW_CARD.format(
+                        school_name=school_name, district=district_name, block=block_name,
+                        category=school_category, management=school_management, total_dropouts=total_dropouts,
+                        rank=school_rank_in_block, school_count=total_schools_in_block
+                    ), unsafe_allow_html=True)
                     
+                    # METRICS ROW - heading and all six cards in one element
                     metrics_data = [
-                        (col_m1, "👧 Girls", girls_dropouts, "#ec407a"),
-                        (col_m2, "👦 Boys", boys_dropouts, "#2980b9"),
-                        (col_m3, "📘 Primary", primary_count, "#9b59b6"),
-                        (col_m4, "📗 Upper Pri.", upper_primary_count, "#16a085"),
-                        (col_m5, "📙 Secondary", secondary_count, "#e67e22"),
-                        (col_m6, "📕 Sr. Sec.", sr_secondary_count, "#c0392b")
+                        ("👧 Girls", girls_dropouts, "#ec407a"),
+                        ("👦 Boys", boys_dropouts, "#2980b9"),
+                        ("📘 Primary", primary_count, "#9b59b6"),
+                        ("📗 Upper Pri.", upper_primary_count, "#16a085"),
+                        ("📙 Secondary", secondary_count, "#e67e22"),
+                        ("📕 Sr. Sec.", sr_secondary_count, "#c0392b")
                     ]
-                    
-                    for col, label, value, color in metrics_data:
-                        with col:
-                            st.markdown(f"""
-                            <div style='background: rgba(255,255,255,0.1); 
-                                        padding: 1.5rem; 
-                                        border-radius: 15px; 
-                                        text-align: center;
-                                        border-left: 4px solid {color};
-                                        box-shadow: 0 4px 8px rgba(0,0,0,0.2);'>
-                                <p style='color: rgba(255,255,255,0.8); font-size: 0.85rem; margin: 0;'>{label}</p>
-                                <h2 style='color: {color}; font-size: 2rem; margin: 0.5rem 0 0 0; font-weight: bold;'>{value:,}</h2>
-                            </div>
-                            """, unsafe_allow_html=True)
+                    metric_cards = "".join(
+                        SCHOOL_METRIC_CARD.format(label=label, value=value, color=color)
+                        for label, value, color in metrics_data
+                    )
+                    st.markdown(
+                        "<div><h3 style='color: white; text-align: center; font-size: 1.8rem; margin: 2rem 0 1.5rem 0; font-weight: bold;'>📊 Dropout Breakdown</h3>"
+                        f"<div style='display: grid; grid-template-columns: repeat(6, 1fr); gap: 1rem;'>{metric_cards}</div></div>",
+                        unsafe_allow_html=True
+                    )
                     
                     st.markdown("<br><br>", unsafe_allow_html=True)
                     
@@ -2924,15 +3016,17 @@ elif st.session_state.active_tab == 3:
                     </h3>
                     """, unsafe_allow_html=True)
                     
-                    # Add search box for filtering
-                    col_search1, col_search2 = st.columns([3, 1])
-                    with col_search1:
-                        search_text = st.text_input("🔍 Search by Student Name, Father/Mother Name, Mobile, or Class:", 
-                                                    key="student_search", 
-                                                    placeholder="Type to search...")
-                    with col_search2:
-                        st.markdown("<br>", unsafe_allow_html=True)
-                        show_all_cols = st.checkbox("Show All Columns", value=False)
+                    # Add search box for filtering - inside a form, so the records are re-queried once per Search click
+                    with st.form("student_search_form", border=False):
+                        col_search1, col_search2 = st.columns([3, 1])
+                        with col_search1:
+                            search_text = st.text_input("🔍 Search by Student Name, Father/Mother Name, Mobile, or Class:", 
+                                                        key="student_search", 
+                                                        placeholder="Type to search...")
+                        with col_search2:
+                            st.markdown("<br>", unsafe_allow_html=True)
+                            show_all_cols = st.checkbox("Show All Columns", value=False)
+                        st.form_submit_button("🔍 Search")
                     
                     # Define display columns with all important information
                     if show_all_cols:
@@ -2948,54 +3042,61 @@ elif st.session_state.active_tab == 3:
                             'Last Class', 'Gender', 'Education Level', 'Academic Year'
                         ]
                     
-                    available_cols = [col for col in display_cols if col in school_df.columns]
+                    available_cols = [col for col in display_cols if col in DROPOUT_COLUMNS]
                     
                     if available_cols:
-                        # Filter dataframe based on search
-                        display_df = school_df[available_cols].copy()
+                        # Arrow tables straight from DuckDB - st.dataframe and the row counts take them as is
+                        school_records = load_school_records(selected_school, school_year, school_selected_district,
+                                                             school_selected_block, tuple(available_cols))
                         
+                        # Filter records based on search - matched inside DuckDB
                         if search_text:
-                            # Create search mask across all string columns
-                            mask = display_df.astype(str).apply(
-                                lambda x: x.str.contains(search_text, case=False, na=False)
-                            ).any(axis=1)
-                            display_df = display_df[mask]
+                            display_records = load_school_records(selected_school, school_year, school_selected_district,
+                                                                  school_selected_block, tuple(available_cols), search_text)
+                        else:
+                            display_records = school_records
                         
                         # Show count
                         st.markdown(f"""
                         <p style='color: white; text-align: center; font-size: 1rem; margin-bottom: 1rem;'>
-                            Showing <strong>{len(display_df)}</strong> of <strong>{len(school_df)}</strong> students
+                            Showing <strong>{display_records.num_rows}</strong> of <strong>{school_records.num_rows}</strong> students
                         </p>
                         """, unsafe_allow_html=True)
                         
-                        # Display table
+                        # Display table - only the current page is sent to the browser; the downloads below keep every row
+                        page_count = max(1, -(-display_records.num_rows // RECORDS_PAGE_SIZE))
+                        if page_count > 1:
+                            records_page = st.number_input(f"Page (of {page_count}):", min_value=1, max_value=page_count,
+                                                           value=1, step=1, key="student_records_page")
+                        else:
+                            records_page = 1
                         st.dataframe(
-                            display_df.reset_index(drop=True),
+                            display_records.slice((records_page - 1) * RECORDS_PAGE_SIZE, RECORDS_PAGE_SIZE),
                             use_container_width=True,
                             height=400
                         )
                         
-                        # Download buttons
+                        # Download buttons - the CSV is only encoded when a button is clicked
                         col_dl1, col_dl2 = st.columns(2)
                         
                         with col_dl1:
-                            csv = display_df.to_csv(index=False).encode('utf-8')
                             st.download_button(
                                 label="📥 Download Filtered Data (CSV)",
-                                data=csv,
+                                data=lambda records=display_records: arrow_csv_bytes(records),
                                 file_name=f"{school_name.replace(' ', '_')}_filtered_data.csv",
                                 mime="text/csv",
+                                help=CSV_DOWNLOAD_HELP,
                                 use_container_width=True
                             )
                         
                         with col_dl2:
                             # Full data download
-                            csv_full = school_df[available_cols].to_csv(index=False).encode('utf-8')
                             st.download_button(
                                 label="📥 Download All School Data (CSV)",
-                                data=csv_full,
+                                data=lambda records=school_records: arrow_csv_bytes(records),
                                 file_name=f"{school_name.replace(' ', '_')}_complete_data.csv",
                                 mime="text/csv",
+                                help=CSV_DOWNLOAD_HELP,
                                 use_container_width=True
                             )
                     else:
@@ -3032,290 +3133,217 @@ elif st.session_state.active_tab == 4:
     </div>
     """, unsafe_allow_html=True)
     
-    # FILTER SECTION
-    st.markdown("### 🎯 Apply Filters")
-    
-    col_f1, col_f2, col_f3 = st.columns(3)
-    
-    with col_f1:
-        st.markdown("**📅 Academic Year**")
-        report_years = st.multiselect(
-            "Select Years:",
-            options=available_years,
-            default=[available_years[0]] if available_years else [],
-            key="report_years",
-            label_visibility="collapsed"
-        )
-    
-    with col_f2:
-        st.markdown("**🗺️ District**")
-        all_districts = con.execute(f'SELECT DISTINCT "District Name" FROM "{csv_file}" ORDER BY "District Name"').df()['District Name'].tolist()
-        report_districts = st.multiselect(
-            "Select Districts:",
-            options=["All"] + all_districts,
-            default=["All"],
-            key="report_districts",
-            label_visibility="collapsed"
-        )
-    
-    with col_f3:
-        st.markdown("**👥 Gender**")
-        report_gender = st.multiselect(
-            "Select Gender:",
-            options=["All", FEMALE_VALUE, MALE_VALUE],
-            default=["All"],
-            key="report_gender",
-            label_visibility="collapsed"
-        )
-    
-    col_f4, col_f5, col_f6 = st.columns(3)
-    
-    with col_f4:
-        st.markdown("**📚 Education Level**")
-        edu_levels = ["All", "Primary (1-5)", "Upper Primary (6-8)", "Secondary (9-10)", "Sr. Secondary (11-12)"]
-        report_edu_level = st.multiselect(
-            "Select Levels:",
-            options=edu_levels,
-            default=["All"],
-            key="report_edu_level",
-            label_visibility="collapsed"
-        )
-    
-    with col_f5:
-        st.markdown("**🏫 School Category**")
-        categories = con.execute(f'SELECT DISTINCT "School Category" FROM "{csv_file}" WHERE "School Category" IS NOT NULL').df()['School Category'].tolist()
-        report_category = st.multiselect(
-            "Select Categories:",
-            options=["All"] + categories,
-            default=["All"],
-            key="report_category",
-            label_visibility="collapsed"
-        )
-    
-    with col_f6:
-        st.markdown("**🏛️ Management Type**")
-        management_types = con.execute(f'SELECT DISTINCT "School Management" FROM "{csv_file}" WHERE "School Management" IS NOT NULL').df()['School Management'].tolist()
-        report_management = st.multiselect(
-            "Select Management:",
-            options=["All"] + management_types,
-            default=["All"],
-            key="report_management",
-            label_visibility="collapsed"
-        )
-    
-    st.markdown("<br>", unsafe_allow_html=True)
-    
-    # COLUMN SELECTION
-    st.markdown("### 📋 Select Columns to Include")
-    
-    all_columns = [
-        'Student Name', 'Father Name', 'Mother Name', 'Mobile No.', 'Last Class',
-        'Gender', 'Education Level', 'School Category', 'School Management',
-        'District Name', 'Block Name', 'Last School Name', 'Academic Year',
-        'Student Status', 'Student Sub Status', 'Aadhaar No.', 'Student PEN', 'Remarks'
-    ]
-    
-    col_sel1, col_sel2 = st.columns([3, 1])
-    with col_sel1:
-        selected_columns = st.multiselect(
-            "Choose columns for your report:",
-            options=all_columns,
-            default=['Student Name', 'Father Name', 'Mother Name', 'Mobile No.', 'Last Class', 'Gender', 'Education Level', 'District Name', 'Academic Year'],
-            key="selected_columns"
-        )
-    
-    with col_sel2:
+    @st.fragment
+    def render_report_builder():
+        """Render the report filters and results; widget changes rerun only this fragment"""
+        # FILTER SECTION
+        st.markdown("### 🎯 Apply Filters")
+        
+        col_f1, col_f2, col_f3 = st.columns(3)
+        
+        with col_f1:
+            st.markdown("**📅 Academic Year**")
+            report_years = st.multiselect(
+                "Select Years:",
+                options=available_years,
+                default=[available_years[0]] if available_years else [],
+                key="report_years",
+                label_visibility="collapsed"
+            )
+        
+        with col_f2:
+            st.markdown("**🗺️ District**")
+            all_districts = get_districts("All")
+            report_districts = st.multiselect(
+                "Select Districts:",
+                options=["All"] + all_districts,
+                default=["All"],
+                key="report_districts",
+                label_visibility="collapsed"
+            )
+        
+        with col_f3:
+            st.markdown("**👥 Gender**")
+            report_gender = st.multiselect(
+                "Select Gender:",
+                options=["All", FEMALE_VALUE, MALE_VALUE],
+                default=["All"],
+                key="report_gender",
+                label_visibility="collapsed"
+            )
+        
+        col_f4, col_f5, col_f6 = st.columns(3)
+        
+        with col_f4:
+            st.markdown("**📚 Education Level**")
+            edu_levels = ["All", "Primary (1-5)", "Upper Primary (6-8)", "Secondary (9-10)", "Sr. Secondary (11-12)"]
+            report_edu_level = st.multiselect(
+                "Select Levels:",
+                options=edu_levels,
+                default=["All"],
+                key="report_edu_level",
+                label_visibility="collapsed"
+            )
+        
+        with col_f5:
+            st.markdown("**🏫 School Category**")
+            categories = get_column_values("School Category")
+            report_category = st.multiselect(
+                "Select Categories:",
+                options=["All"] + categories,
+                default=["All"],
+                key="report_category",
+                label_visibility="collapsed"
+            )
+        
+        with col_f6:
+            st.markdown("**🏛️ Management Type**")
+            management_types = get_column_values("School Management")
+            report_management = st.multiselect(
+                "Select Management:",
+                options=["All"] + management_types,
+                default=["All"],
+                key="report_management",
+                label_visibility="collapsed"
+            )
+        
         st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("Select All Columns", use_container_width=True):
-            st.session_state.selected_columns = all_columns
-            st.rerun()
-    
-    st.markdown("<br>", unsafe_allow_html=True)
-    
-    # GENERATE REPORT BUTTON
-    if st.button("🔍 Generate Custom Report", type="primary", use_container_width=True):
-        with st.spinner('📊 Generating custom report...'):
-            try:
-                # Build SQL query with filters
-                conditions = []
-                
-                # Year filter
-                if report_years:
-                    year_list = "', '".join(report_years)
-                    conditions.append(f'"Academic Year" IN (\'{year_list}\')')
-                
-                # District filter
-                if "All" not in report_districts and report_districts:
-                    district_list = "', '".join(report_districts)
-                    conditions.append(f'"District Name" IN (\'{district_list}\')')
-                
-                # Gender filter
-                if "All" not in report_gender and report_gender:
-                    gender_list = "', '".join(report_gender)
-                    conditions.append(f'"Gender" IN (\'{gender_list}\')')
-                
-                # Education Level filter
-                if "All" not in report_edu_level and report_edu_level:
-                    edu_list = "', '".join(report_edu_level)
-                    conditions.append(f'"Education Level" IN (\'{edu_list}\')')
-                
-                # School Category filter
-                if "All" not in report_category and report_category:
-                    cat_list = "', '".join(report_category)
-                    conditions.append(f'"School Category" IN (\'{cat_list}\')')
-                
-                # Management filter
-                if "All" not in report_management and report_management:
-                    mgmt_list = "', '".join(report_management)
-                    conditions.append(f'"School Management" IN (\'{mgmt_list}\')')
-                
-                # Build WHERE clause
-                where_clause = " AND ".join(conditions) if conditions else "1=1"
-                
-                # Execute query
-                query = f'SELECT * FROM "{csv_file}" WHERE {where_clause}'
-                report_df = con.execute(query).df()
-                
-                # Filter columns
-                available_selected_cols = [col for col in selected_columns if col in report_df.columns]
-                
-                if available_selected_cols:
-                    filtered_report_df = report_df[available_selected_cols]
-                    
-                    # REPORT SUMMARY
-                    st.markdown("""
-                    <h3 style='color: white; text-align: center; font-size: 1.8rem; margin: 2rem 0 1.5rem 0; font-weight: bold;'>
-                        📊 Report Summary
-                    </h3>
-                    """, unsafe_allow_html=True)
-                    
-                    col_sum1, col_sum2, col_sum3, col_sum4 = st.columns(4)
-                    
-                    with col_sum1:
-                        st.markdown(f"""
-                        <div style='background: linear-gradient(135deg, #667eea, #764ba2); 
-                                    padding: 1.5rem; 
-                                    border-radius: 15px; 
-                                    text-align: center;
-                                    box-shadow: 0 6px 12px rgba(0,0,0,0.3);'>
-                            <p style='color: rgba(255,255,255,0.8); font-size: 0.9rem; margin: 0;'>📝 Total Records</p>
-                            <h2 style='color: white; font-size: 2.5rem; margin: 0.5rem 0 0 0; font-weight: bold;'>{len(filtered_report_df):,}</h2>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col_sum2:
-                        girls_count = len(filtered_report_df[filtered_report_df['Gender'] == FEMALE_VALUE]) if 'Gender' in filtered_report_df.columns else 0
-                        st.markdown(f"""
-                        <div style='background: linear-gradient(135deg, #ec407a, #f48fb1); 
-                                    padding: 1.5rem; 
-                                    border-radius: 15px; 
-                                    text-align: center;
-                                    box-shadow: 0 6px 12px rgba(0,0,0,0.3);'>
-                            <p style='color: rgba(255,255,255,0.8); font-size: 0.9rem; margin: 0;'>👧 Girls</p>
-                            <h2 style='color: white; font-size: 2.5rem; margin: 0.5rem 0 0 0; font-weight: bold;'>{girls_count:,}</h2>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
-                    with col_sum3:
-                        boys_count = len(filtered_report_df[filtered_report_df['Gender'] == MALE_VALUE]) if 'Gender' in filtered_report_df.columns else 0
-                        st.markdown(f"""
-                        <div style='background: linear-gradient(135deg, #2980b9, #3498db); 
-                                    padding: 1.5rem; 
-                                    border-radius: 15px; 
-                                    text-align: center;
-                                    box-shadow: 0 6px 12px rgba(0,0,0,0.3);'>
-                            <p style='color: rgba(255,255,255,0.8); font-size: 0.9rem; margin: 0;'>👦 Boys</p>
-                            <h2 style='color: white; font-size: 2.5rem; margin: 0.5rem 0 0 0; font-weight: bold;'>{boys_count:,}</h2>
-                        </div>
+        
+        # COLUMN SELECTION
+        st.markdown("### 📋 Select Columns to Include")
+        
+        all_columns = [
+            'Student Name', 'Father Name', 'Mother Name', 'Mobile No.', 'Last Class',
+            'Gender', 'Education Level', 'School Category', 'School Management',
+            'District Name', 'Block Name', 'Last School Name', 'Academic Year',
+            'Student Status', 'Student Sub Status', 'Aadhaar No.', 'Student PEN', 'Remarks'
+        ]
+        
+        col_sel1, col_sel2 = st.columns([3, 1])
+        with col_sel1:
+            selected_columns = st.multiselect(
+                "Choose columns for your report:",
+                options=all_columns,
+                default=['Student Name', 'Father Name', 'Mother Name', 'Mobile No.', 'Last Class', 'Gender', 'Education Level', 'District Name', 'Academic Year'],
+                key="selected_columns"
+            )
+        
+        with col_sel2:
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("Select All Columns", use_container_width=True):
+                st.session_state.selected_columns = all_columns
+                st.rerun(scope="fragment")
+        
+        st.markdown("<br>", unsafe_allow_html=True)
+        
+        # GENERATE REPORT BUTTON - the click stores the selections; the report below is rendered
+        # from them on every rerun, so it stays on screen and comes back from the cache
+        if st.button("🔍 Generate Custom Report", type="primary", use_container_width=True):
+            st.session_state.report_request = (
+                tuple(report_years), tuple(report_districts), tuple(report_gender),
+                tuple(report_edu_level), tuple(report_category), tuple(report_management),
+                tuple(col for col in selected_columns if col in DROPOUT_COLUMNS)
+            )
+        
+        report_request = st.session_state.get("report_request")
+        if report_request:
+            with st.spinner('📊 Generating custom report...'):
+                try:
+                    # Cards and preview come from small queries; the full rows are only fetched by the download buttons
+                    if report_request[-1]:
+                        total_records, girls_count, boys_count, unique_districts = load_report_summary(*report_request[:-1])
+                        
+                        # REPORT SUMMARY
+                        st.markdown("""
+                        <h3 style='color: white; text-align: center; font-size: 1.8rem; margin: 2rem 0 1.5rem 0; font-weight: bold;'>
+                            📊 Report Summary
+                        </h3>
                         """, unsafe_allow_html=True)
-                    
-                    with col_sum4:
-                        unique_districts = filtered_report_df['District Name'].nunique() if 'District Name' in filtered_report_df.columns else 0
-                        st.markdown(f"""
-                        <div style='background: linear-gradient(135deg, #16a085, #27ae60); 
-                                    padding: 1.5rem; 
-                                    border-radius: 15px; 
-                                    text-align: center;
-                                    box-shadow: 0 6px 12px rgba(0,0,0,0.3);'>
-                            <p style='color: rgba(255,255,255,0.8); font-size: 0.9rem; margin: 0;'>🗺️ Districts</p>
-                            <h2 style='color: white; font-size: 2.5rem; margin: 0.5rem 0 0 0; font-weight: bold;'>{unique_districts}</h2>
-                        </div>
+                        
+                        # st.metric cards - colours come from the report_metric_* rules in the CSS block at the top
+                        summary_cards = [
+                            ("total", "📝 Total Records", f"{total_records:,}"),
+                            ("girls", "👧 Girls", f"{girls_count:,}"),
+                            ("boys", "👦 Boys", f"{boys_count:,}"),
+                            ("districts", "🗺️ Districts", f"{unique_districts:,}"),
+                        ]
+                        for col, (name, title, value) in zip(st.columns(4), summary_cards):
+                            col.container(key=f"report_metric_{name}").metric(title, value)
+                        
+                        st.markdown("<br><br>", unsafe_allow_html=True)
+                        
+                        # DATA PREVIEW
+                        st.markdown("""
+                        <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
+                            👁️ Data Preview
+                        </h3>
                         """, unsafe_allow_html=True)
-                    
-                    st.markdown("<br><br>", unsafe_allow_html=True)
-                    
-                    # DATA PREVIEW
-                    st.markdown("""
-                    <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                        👁️ Data Preview
-                    </h3>
-                    """, unsafe_allow_html=True)
-                    
-                    st.dataframe(
-                        filtered_report_df.head(100),
-                        use_container_width=True,
-                        height=400
-                    )
-                    
-                    st.info(f"💡 Showing first 100 rows. Full report contains {len(filtered_report_df):,} records.")
-                    
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    
-                    # DOWNLOAD SECTION
-                    st.markdown("""
-                    <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
-                        📥 Download Report
-                    </h3>
-                    """, unsafe_allow_html=True)
-                    
-                    col_dl1, col_dl2, col_dl3 = st.columns(3)
-                    
-                    with col_dl1:
-                        csv_data = filtered_report_df.to_csv(index=False).encode('utf-8')
-                        st.download_button(
-                            label="📄 Download as CSV",
-                            data=csv_data,
-                            file_name=f"custom_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            mime="text/csv",
-                            use_container_width=True
-                        )
-                    
-                    with col_dl2:
-                        # Excel download
-                        from io import BytesIO
-                        excel_buffer = BytesIO()
-                        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-                            filtered_report_df.to_excel(writer, index=False, sheet_name='Dropout Report')
-                        excel_data = excel_buffer.getvalue()
                         
-                        st.download_button(
-                            label="📊 Download as Excel",
-                            data=excel_data,
-                            file_name=f"custom_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            use_container_width=True
-                        )
-                    
-                    with col_dl3:
-                        # JSON download
-                        json_data = filtered_report_df.to_json(orient='records', indent=2).encode('utf-8')
-                        st.download_button(
-                            label="🗂️ Download as JSON",
-                            data=json_data,
-                            file_name=f"custom_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.json",
-                            mime="application/json",
-                            use_container_width=True
+                        st.dataframe(
+                            load_report_preview(*report_request),
+                            use_container_width=True,
+                            height=400
                         )
-                    
-                else:
-                    st.warning("⚠️ No matching columns found in the dataset")
-                    
-            except Exception as e:
-                st.error(f"❌ Error generating report: {e}")
-                import traceback
-                st.code(traceback.format_exc())
-    else:
-        st.info("👆 Configure filters above and click 'Generate Custom Report' to create your customized dropout analysis report")
+                        
+                        st.info(f"💡 Showing first 100 rows. Full report contains {total_records:,} records.")
+                        
+                        st.markdown("<br>", unsafe_allow_html=True)
+                        
+                        # DOWNLOAD SECTION
+                        st.markdown("""
+                        <h3 style='color: white; text-align: center; font-size: 1.8rem; margin-bottom: 1.5rem; font-weight: bold;'>
+                            📥 Download Report
+                        </h3>
+                        """, unsafe_allow_html=True)
+                        
+                        # Each file is only fetched and serialized when its button is clicked; on_click="ignore"
+                        # skips the rerun a download would otherwise trigger
+                        col_dl1, col_dl2, col_dl3 = st.columns(3)
+                        
+                        with col_dl1:
+                            st.download_button(
+                                label="📄 Download as CSV",
+                                data=lambda request=report_request: report_csv_bytes(*request),
+                                file_name=f"custom_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                                mime="text/csv",
+                                help=CSV_DOWNLOAD_HELP,
+                                on_click="ignore",
+                                use_container_width=True
+                            )
+                        
+                        with col_dl2:
+                            # Excel download
+                            st.download_button(
+                                label="📊 Download as Excel",
+                                data=lambda request=report_request: report_excel_bytes(load_custom_report(*request)),
+                                file_name=f"custom_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                on_click="ignore",
+                                use_container_width=True
+                            )
+                        
+                        with col_dl3:
+                            # JSON download
+                            st.download_button(
+                                label="🗂️ Download as JSON",
+                                data=lambda request=report_request: load_custom_report(*request).to_json(orient='records', indent=2).encode('utf-8'),
+                                file_name=f"custom_report_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.json",
+                                mime="application/json",
+                                on_click="ignore",
+                                use_container_width=True
+                            )
+                        
+                    else:
+                        st.warning("⚠️ No matching columns found in the dataset")
+                        
+                except Exception as e:
+                    st.error(f"❌ Error generating report: {e}")
+                    import traceback
+                    st.code(traceback.format_exc())
+        else:
+            st.info("👆 Configure filters above and click 'Generate Custom Report' to create your customized dropout analysis report")
+    
+    render_report_builder()
 
 
 # FOOTER